@@ -0,0 +1,110 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+import metrics
+
+# --- CONFIG ---
+MAX_CONCURRENT = int(os.environ.get("SEIKAKU_MAX_CONCURRENT", "2"))
+MAX_QUEUE = int(os.environ.get("SEIKAKU_MAX_QUEUE", "16"))
+# How often a queued request checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 0.25
+
+ADMISSIONS = metrics.Counter("seikaku_admissions_total", "Admission decisions by outcome.", ("endpoint", "outcome"))
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ClientGone(Exception):
+    pass
+
+
+class AdmissionController:
+    """Bounded FIFO admission: `max_concurrent` running, `max_queue` waiting.
+
+    Anything beyond that is rejected straight away with a Retry-After
+    estimate instead of queueing until the client times out.
+    """
+
+    def __init__(self, endpoint, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE):
+        self.endpoint = endpoint
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self._waiters = deque()
+        # Smoothed processing time, used for the Retry-After estimate
+        self._service_seconds = 5.0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        backlog = self.queued + self.active
+        return max(1, math.ceil(self._service_seconds * backlog / self.max_concurrent))
+
+    async def acquire(self, is_disconnected=None):
+        """Waits for a slot; returns the seconds spent queued."""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            ADMISSIONS.inc(self.endpoint, "admitted")
+            return 0.0
+        if self.queued >= self.max_queue:
+            ADMISSIONS.inc(self.endpoint, "rejected")
+            raise Overloaded(self.retry_after())
+
+        start = time.perf_counter()
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters.append(slot)
+        self._update_depth()
+        try:
+            while not slot.done():
+                await asyncio.wait({slot}, timeout=DISCONNECT_POLL_SECONDS)
+                if not slot.done() and is_disconnected is not None and await is_disconnected():
+                    ADMISSIONS.inc(self.endpoint, "abandoned")
+                    raise ClientGone()
+        except BaseException:
+            if slot.done() and not slot.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                slot.cancel()
+                if slot in self._waiters:
+                    self._waiters.remove(slot)
+            raise
+        finally:
+            self._update_depth()
+
+        ADMISSIONS.inc(self.endpoint, "admitted")
+        return time.perf_counter() - start
+
+    def release(self, service_seconds=None):
+        if service_seconds is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * service_seconds
+        # Hand the slot straight to the oldest live waiter (active count unchanged)
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                self._update_depth()
+                return
+        self.active -= 1
+        self._update_depth()
+
+    def _update_depth(self):
+        metrics.QUEUE_DEPTH.set(self.queued, self.endpoint)
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "retry_after": self.retry_after(),
+        }
@@ -0,0 +1,188 @@
+import math
+
+import numpy as np
+
+# --- CONFIG ---
+# Reference search compares contours resampled to a common length inside a
+# Sakoe-Chiba band; the lower bounds below are only valid for that DTW.
+INDEX_LENGTH = 128
+BAND_RADIUS = 12
+
+
+def resample(x, n=INDEX_LENGTH):
+    """Linear resampling of a contour to exactly n points."""
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == 0:
+        return np.zeros(n)
+    if len(x) == 1:
+        return np.full(n, x[0])
+    return np.interp(np.linspace(0, len(x) - 1, n), np.arange(len(x)), x)
+
+
+def envelope(x, radius=BAND_RADIUS):
+    """(upper, lower) running max/min over +/- radius, as used by LB_Keogh."""
+    from scipy.ndimage import maximum_filter1d, minimum_filter1d
+
+    size = 2 * radius + 1
+    return maximum_filter1d(x, size, mode="nearest"), minimum_filter1d(x, size, mode="nearest")
+
+
+def lb_kim(q, c):
+    """O(1) bound: every warping path matches the first and the last points."""
+    if len(q) < 2 or len(c) < 2:
+        return abs(q[0] - c[0])
+    return abs(q[0] - c[0]) + abs(q[-1] - c[-1])
+
+
+def lb_keogh(q, upper, lower):
+    """O(n) bound: distance from q to the candidate's band envelope."""
+    return float(np.sum(np.maximum(q - upper, 0) + np.maximum(lower - q, 0)))
+
+
+def banded_dtw(a, b, radius=BAND_RADIUS, best_so_far=math.inf):
+    """Exact DTW (abs cost, summed) restricted to |i - j| <= radius.
+
+    Abandons early and returns inf as soon as a whole row exceeds
+    best_so_far, since the final distance can only grow from there.
+    """
+    # Plain floats: per-element numpy indexing is several times slower in this loop
+    a, b = np.asarray(a, dtype=np.float64).tolist(), np.asarray(b, dtype=np.float64).tolist()
+    n, m = len(a), len(b)
+    radius = max(radius, abs(n - m))
+    inf = math.inf
+    prev = [inf] * (m + 1)
+    prev[0] = 0.0
+    for i in range(1, n + 1):
+        curr = [inf] * (m + 1)
+        ai = a[i - 1]
+        lo, hi = max(1, i - radius), min(m, i + radius)
+        row_min = inf
+        for j in range(lo, hi + 1):
+            best = prev[j - 1]
+            if prev[j] < best:
+                best = prev[j]
+            if curr[j - 1] < best:
+                best = curr[j - 1]
+            cost = abs(ai - b[j - 1]) + best
+            curr[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > best_so_far:
+            return inf
+        prev = curr
+    return prev[m]
+
+
+# --- COARSE-TO-FINE ---
+# Pyramid levels halve the contour until it is shorter than this
+MIN_COARSE_LENGTH = 16
+# Cells around the projected coarse path that are re-examined at the next level
+REFINE_RADIUS = 2
+
+
+def pyramid(x, min_length=MIN_COARSE_LENGTH):
+    """[x, x/2, x/4, ...]: each level averages adjacent pairs of the one above."""
+    levels = [np.asarray(x, dtype=np.float64)]
+    while len(levels[-1]) >= 2 * min_length:
+        prev = levels[-1]
+        even = prev[: len(prev) // 2 * 2]
+        levels.append(even.reshape(-1, 2).mean(axis=1))
+    return levels
+
+
+def pyramid_features(norm_pitch):
+    """Coarse levels stored per reference (level 0 is norm_pitch itself)."""
+    return {f"pyramid_{k}": level for k, level in enumerate(pyramid(norm_pitch)[1:], start=1)}
+
+
+def load_pyramid(entry):
+    levels = [entry["norm_pitch"]]
+    while f"pyramid_{len(levels)}" in entry:
+        levels.append(entry[f"pyramid_{len(levels)}"])
+    return levels
+
+
+def windowed_dtw(a, b, window):
+    """DTW (abs cost) over the cells in window[i] = (lo, hi) for each row i.
+
+    Returns (distance, path) with path as a list of (i, j) pairs.
+    """
+    a, b = np.asarray(a, dtype=np.float64).tolist(), np.asarray(b, dtype=np.float64).tolist()
+    n = len(a)
+    inf = math.inf
+    cost = [dict() for _ in range(n)]
+    for i in range(n):
+        lo, hi = window[i]
+        ai = a[i]
+        row, above = cost[i], cost[i - 1] if i else None
+        for j in range(lo, hi + 1):
+            if i == 0 and j == 0:
+                best = 0.0
+            else:
+                best = row.get(j - 1, inf)
+                if above is not None:
+                    best = min(best, above.get(j, inf), above.get(j - 1, inf))
+            row[j] = abs(ai - b[j]) + best
+
+    # Backtrack from the last cell
+    i, j = n - 1, len(b) - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        steps = []
+        if i > 0 and j > 0:
+            steps.append((cost[i - 1].get(j - 1, inf), i - 1, j - 1))
+        if i > 0:
+            steps.append((cost[i - 1].get(j, inf), i - 1, j))
+        if j > 0:
+            steps.append((cost[i].get(j - 1, inf), i, j - 1))
+        _, i, j = min(steps)
+        path.append((i, j))
+    path.reverse()
+    return cost[n - 1][len(b) - 1], path
+
+
+def _project_window(path, n, m, radius):
+    """Row ranges at the finer level covered by a coarse path, widened by radius."""
+    lo, hi = [m] * n, [-1] * n
+    for ci, cj in path:
+        for i in range(2 * ci - radius, 2 * ci + 2 + radius):
+            if 0 <= i < n:
+                lo[i] = min(lo[i], max(0, 2 * cj - radius))
+                hi[i] = max(hi[i], min(m - 1, 2 * cj + 1 + radius))
+    for i in range(n):
+        if hi[i] < 0:
+            # Row not reached by the projection (only possible with radius 0)
+            lo[i], hi[i] = (lo[i - 1] if i else 0), m - 1
+        elif i and lo[i] > hi[i - 1] + 1:
+            # Keep consecutive rows connected so a warping path always exists
+            lo[i] = hi[i - 1] + 1
+    lo[0], hi[-1] = 0, m - 1
+    return list(zip(lo, hi))
+
+
+def coarse_to_fine(ref_levels, user, radius=REFINE_RADIUS):
+    """Multi-resolution DTW: exact at the coarsest level, then refined inside
+    the projected window at each finer level. Cost is O((n + m) * radius).
+
+    ref_levels is the reference pyramid (precomputed once per reference);
+    the user pyramid is built here. Returns (distance, path) at full resolution.
+    """
+    user_levels = pyramid(user)
+    depth = min(len(ref_levels), len(user_levels)) - 1
+
+    a, b = ref_levels[depth], user_levels[depth]
+    dist, path = windowed_dtw(a, b, [(0, len(b) - 1)] * len(a))
+    for level in range(depth - 1, -1, -1):
+        a, b = ref_levels[level], user_levels[level]
+        dist, path = windowed_dtw(a, b, _project_window(path, len(a), len(b), radius))
+    return dist, path
+
+
+def downsample_aligned(ref_aligned, user_aligned, regions, max_points):
+    """Thins aligned series for plotting/returning; region indices are rescaled."""
+    n = len(ref_aligned)
+    if n <= max_points:
+        return ref_aligned, user_aligned, regions
+    step = math.ceil(n / max_points)
+    regions = [dict(r, start_index=r["start_index"] // step, end_index=r["end_index"] // step) for r in regions]
+    return ref_aligned[::step], user_aligned[::step], regions
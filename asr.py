@@ -0,0 +1,255 @@
+import ctypes
+import gc
+import json
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+# --- CONFIG ---
+# Model tier and precision for the content check. "small" in fp32 is the
+# original setup; run whisper_bench.py to compare a smaller tier or int8
+# against it before switching.
+MODEL_TIERS = ("tiny", "base", "small")
+PRECISIONS = ("fp32", "int8")
+
+WHISPER_MODEL = os.environ.get("SEIKAKU_WHISPER_MODEL", "small")
+WHISPER_PRECISION = os.environ.get("SEIKAKU_WHISPER_PRECISION", "fp32")
+
+# When set, server workers send audio to the shared model in asr_sidecar.py
+# over this Unix socket instead of each loading their own copy.
+SIDECAR_SOCKET = os.environ.get("SEIKAKU_ASR_SOCKET")
+SIDECAR_TIMEOUT = float(os.environ.get("SEIKAKU_ASR_TIMEOUT", "60"))
+
+# Idle policy: after this many seconds without a transcription the model is
+# dropped and loaded again (with a warm-up decode) on the next request.
+# 0 keeps it resident forever.
+IDLE_UNLOAD_SECONDS = float(os.environ.get("SEIKAKU_WHISPER_IDLE_SECONDS", "0"))
+# Also hand freed heap back to the OS (malloc_trim) and empty the CUDA cache on unload
+IDLE_RELEASE_MEMORY = os.environ.get("SEIKAKU_WHISPER_IDLE_RELEASE", "1") != "0"
+
+WHISPER_RESIDENT = metrics.Gauge("seikaku_whisper_resident", "1 while the Whisper model is loaded in this process.")
+WHISPER_TRANSITIONS = metrics.Counter("seikaku_whisper_transitions_total",
+                                      "Whisper model loads and idle unloads.", ("event",))
+
+DECODE_OPTIONS = {
+    "language": "ja",
+    "fp16": False,
+    "initial_prompt": "これは日本語の授業です。",
+
+    # --- ANTI-LOOP & SPEED SETTINGS ---
+    "temperature": 0.0,
+    "beam_size": 1,
+    "best_of": 1,
+    "compression_ratio_threshold": 1.8,
+    "no_speech_threshold": 0.6,
+    "condition_on_previous_text": False,
+    "logprob_threshold": -1.0,
+}
+
+
+def load_model(name=None, precision=None):
+    # Imported on first use (it pulls in torch) so importing the server stays fast
+    import whisper
+
+    name = name or WHISPER_MODEL
+    precision = precision or WHISPER_PRECISION
+    if name not in MODEL_TIERS:
+        raise ValueError(f"Unknown Whisper model '{name}', expected one of {MODEL_TIERS}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+
+    if precision == "int8":
+        # Dynamic quantization only has CPU kernels
+        return quantize_int8(whisper.load_model(name, device="cpu"))
+    return whisper.load_model(name)
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of the Linear layers (attention + MLP weights)."""
+    import torch
+
+    # whisper.model.Linear only subclasses nn.Linear to cast weights to the
+    # input dtype. quantize_dynamic matches exact module types, so present
+    # them as plain nn.Linear first (identical forward in fp32).
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def warm_up(model):
+    """One decode of a second of silence, so the first real request doesn't pay for lazy init."""
+    import whisper
+
+    model.transcribe(np.zeros(whisper.audio.SAMPLE_RATE, dtype=np.float32), **DECODE_OPTIONS)
+
+
+def release_memory():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass  # not glibc
+
+
+class ModelHolder:
+    """The process's Whisper model, loaded on first use and dropped when idle.
+
+    run() serialises calls on the model (Whisper installs kv-cache hooks on
+    it per decode) and reloads it if it was unloaded; unload_if_idle() is
+    called periodically by the server / sidecar.
+    """
+
+    def __init__(self, name=None, precision=None, idle_seconds=IDLE_UNLOAD_SECONDS):
+        self.name = name or WHISPER_MODEL
+        self.precision = precision or WHISPER_PRECISION
+        self.idle_seconds = idle_seconds
+        self.model = None
+        self.loads = 0
+        self.unloads = 0
+        self.last_load_seconds = None
+        self._last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        start = time.perf_counter()
+        model = load_model(self.name, self.precision)
+        if self.loads:
+            # Reloads happen on a user's request; the first load is at startup
+            warm_up(model)
+        self.model = model
+        self.loads += 1
+        self.last_load_seconds = round(time.perf_counter() - start, 3)
+        metrics.WHISPER_LOAD_SECONDS.set(self.last_load_seconds)
+        WHISPER_RESIDENT.set(1)
+        WHISPER_TRANSITIONS.inc("load")
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                self._load()
+            self._last_used = time.monotonic()
+
+    def run(self, fn, *args):
+        """fn(model, *args), loading the model first if needed."""
+        with self._lock:
+            if self.model is None:
+                self._load()
+            try:
+                return fn(self.model, *args)
+            finally:
+                self._last_used = time.monotonic()
+
+    @property
+    def check_interval(self):
+        """How often the idle policy should be checked."""
+        return max(1.0, min(60.0, self.idle_seconds / 4))
+
+    def idle_for(self):
+        return time.monotonic() - self._last_used
+
+    def unload_if_idle(self):
+        """Drops the model after idle_seconds without use. Returns True if it did."""
+        if self.idle_seconds <= 0 or self.model is None or self.idle_for() < self.idle_seconds:
+            return False
+        # Non-blocking: a request holding the lock is, by definition, activity
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self.model is None or self.idle_for() < self.idle_seconds:
+                return False
+            self.model = None
+            self.unloads += 1
+        finally:
+            self._lock.release()
+        if IDLE_RELEASE_MEMORY:
+            release_memory()
+        WHISPER_RESIDENT.set(0)
+        WHISPER_TRANSITIONS.inc("unload")
+        return True
+
+    def stats(self):
+        return {
+            "model": f"{self.name}, {self.precision}",
+            "resident": self.model is not None,
+            "idle_seconds": round(self.idle_for(), 1),
+            "unload_after_seconds": self.idle_seconds or None,
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "last_load_seconds": self.last_load_seconds,
+        }
+
+
+def transcribe(model, audio_path):
+    result = model.transcribe(audio_path, **DECODE_OPTIONS)
+    return result["text"]
+
+
+def transcribe_batch(model, audio_paths):
+    """Transcribes several short clips with one batched decoder pass.
+
+    Mirrors DECODE_OPTIONS at temperature 0 (no fallback), including the
+    no-speech check. Clips longer than Whisper's 30s window go through
+    transcribe() on their own. Returns one text or Exception per path.
+    """
+    import torch
+    import whisper
+
+    results = [None] * len(audio_paths)
+    mels, batch_idx = [], []
+    for i, path in enumerate(audio_paths):
+        try:
+            audio = whisper.load_audio(path)
+            if len(audio) > whisper.audio.N_SAMPLES:
+                results[i] = transcribe(model, path)
+                continue
+            mels.append(whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels))
+            batch_idx.append(i)
+        except Exception as e:
+            results[i] = e
+
+    if mels:
+        options = whisper.DecodingOptions(
+            language=DECODE_OPTIONS["language"],
+            prompt=DECODE_OPTIONS["initial_prompt"],
+            temperature=DECODE_OPTIONS["temperature"],
+            beam_size=DECODE_OPTIONS["beam_size"],
+            fp16=DECODE_OPTIONS["fp16"],
+            without_timestamps=True,
+        )
+        decoded = whisper.decode(model, torch.stack(mels).to(model.device), options)
+        for i, r in zip(batch_idx, decoded):
+            silent = (r.no_speech_prob > DECODE_OPTIONS["no_speech_threshold"]
+                      and r.avg_logprob < DECODE_OPTIONS["logprob_threshold"])
+            results[i] = "" if silent else r.text
+    return results
+
+
+def transcribe_remote(audio_path, socket_path=None, timeout=None):
+    """Sends one clip to the shared sidecar model and returns its text."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout or SIDECAR_TIMEOUT)
+        sock.connect(socket_path or SIDECAR_SOCKET)
+        sock.sendall((json.dumps({"path": os.path.abspath(audio_path)}) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as reply_file:
+            reply = json.loads(reply_file.readline())
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply["text"]
+
+
+def describe():
+    if SIDECAR_SOCKET:
+        return f"shared sidecar at {SIDECAR_SOCKET}"
+    return f"{WHISPER_MODEL}, {WHISPER_PRECISION}"
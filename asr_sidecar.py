@@ -0,0 +1,116 @@
+"""Shared Whisper model for multi-worker deployments.
+
+Loads the model once and serves transcriptions over a Unix socket, so RAM
+for Whisper stays flat as server workers are added:
+
+    python asr_sidecar.py --socket /tmp/seikaku-asr.sock
+    SEIKAKU_ASR_SOCKET=/tmp/seikaku-asr.sock uvicorn main:app --workers 4
+
+Protocol: one JSON line per connection, {"path": "/abs/audio.wav"} in,
+{"text": "..."} or {"error": "..."} out. Workers and the sidecar must share
+the filesystem. Requests that arrive close together are decoded as a batch.
+
+The sidecar opens whatever path a client sends, so the socket is created
+owner-only (SEIKAKU_ASR_SOCKET_MODE=660 to share it with a group). Run it
+as the same user as the server workers: uploads are temp files with mode
+0600 and another user could not read them.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import asr
+
+# --- CONFIG ---
+BATCH_MAX = int(os.environ.get("SEIKAKU_ASR_BATCH_MAX", "8"))
+BATCH_WAIT_MS = float(os.environ.get("SEIKAKU_ASR_BATCH_WAIT_MS", "20"))
+# Octal permissions of the socket file
+SOCKET_MODE = int(os.environ.get("SEIKAKU_ASR_SOCKET_MODE", "600"), 8)
+
+
+async def batcher(holder, queue):
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + BATCH_WAIT_MS / 1000
+        while len(batch) < BATCH_MAX:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        paths = [path for path, _ in batch]
+        try:
+            # Decode off the event loop so new requests keep queueing meanwhile
+            results = await loop.run_in_executor(None, holder.run, asr.transcribe_batch, paths)
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def idle_reaper(holder):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(holder.check_interval)
+        if await loop.run_in_executor(None, holder.unload_if_idle):
+            print(f"💤 Whisper unloaded after {holder.idle_seconds:.0f}s idle")
+
+
+async def handle(reader, writer, queue):
+    try:
+        request = json.loads(await reader.readline())
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((request["path"], future))
+        result = await future
+        if isinstance(result, Exception):
+            reply = {"error": f"{type(result).__name__}: {result}"}
+        else:
+            reply = {"text": result}
+    except (ValueError, KeyError) as e:
+        reply = {"error": f"Bad request: {e}"}
+    writer.write((json.dumps(reply, ensure_ascii=False) + "\n").encode("utf-8"))
+    await writer.drain()
+    writer.close()
+
+
+async def serve(socket_path):
+    print(f"🎧 Loading Whisper Model ({asr.WHISPER_MODEL}, {asr.WHISPER_PRECISION})...")
+    holder = asr.ModelHolder()
+    holder.load()
+    print(f"✅ Whisper Ready in {holder.last_load_seconds:.1f}s.")
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    queue = asyncio.Queue()
+    batch_task = asyncio.create_task(batcher(holder, queue))
+    reaper = asyncio.create_task(idle_reaper(holder)) if holder.idle_seconds > 0 else None
+    # Restrictive umask while binding, so the socket is never reachable with the default mode
+    old_umask = os.umask(0o777 & ~SOCKET_MODE)
+    try:
+        server = await asyncio.start_unix_server(lambda r, w: handle(r, w, queue), path=socket_path)
+    finally:
+        os.umask(old_umask)
+    os.chmod(socket_path, SOCKET_MODE)
+    print(f"🔌 Serving transcriptions on {socket_path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        if reaper is not None:
+            reaper.cancel()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared Whisper sidecar")
+    parser.add_argument("--socket", default=asr.SIDECAR_SOCKET or "/tmp/seikaku-asr.sock")
+    args = parser.parse_args()
+    asyncio.run(serve(args.socket))
@@ -0,0 +1,210 @@
+"""Offline bulk scoring of archived recordings.
+
+Scores many (word_id, file) pairs across a process pool, reusing the
+cached reference contours from the reference store, and streams one result
+per recording to JSONL or CSV as soon as it finishes. Re-running with the
+same --out skips recordings that already have a result, so an interrupted
+run simply resumes; recordings that failed are tried again.
+
+Input is either a directory with one sub-folder per word_id
+(recordings/IMale/*.wav) or a manifest (CSV with word_id,file columns, or
+JSONL with the same keys; relative paths are resolved against the manifest).
+
+    python bulk_score.py recordings/ --out scores.jsonl --workers 8
+    python bulk_score.py manifest.csv --out scores.csv --check-text
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import refstore
+from alignment import load_pyramid
+from pipeline import (REF_FEATURE_VERSION, _extract_pitch, analyze_reference, match_expected_text, reference_inputs,
+                      score_alignment)
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".webm", ".ogg", ".flac")
+RESULT_FIELDS = ["word_id", "file", "score", "raw_score", "text_correct", "heard_text",
+                 "audio_frames", "seconds", "error"]
+
+# --- WORKER STATE (one per process) ---
+_worker = {}
+
+
+def _init_worker(store_path, check_text, multires=False):
+    _worker["store"] = refstore.ReferenceStore(store_path)
+    _worker["check_text"] = check_text
+    _worker["multires"] = multires
+    _worker["model"] = None
+    if check_text:
+        import asr
+        if not asr.SIDECAR_SOCKET:
+            _worker["model"] = asr.load_model()
+
+
+def _check_text(file_path, word_id):
+    import asr
+    if asr.SIDECAR_SOCKET:
+        text = asr.transcribe_remote(file_path)
+    else:
+        text = asr.transcribe(_worker["model"], file_path)
+    return match_expected_text(text, word_id)
+
+
+def score_one(word_id, file_path):
+    start = time.perf_counter()
+    result = {"word_id": word_id, "file": file_path}
+    try:
+        ref = _worker["store"].get(word_id)
+        if ref is None:
+            raise KeyError(f"no reference for '{word_id}'")
+        # process_audio_file() scores undecodable audio as silence; here that must be an error
+        user_norm, audio, _, _ = _extract_pitch(file_path)
+        if audio is None:
+            raise ValueError("could not decode audio")
+        ref_levels = load_pyramid(ref) if _worker["multires"] else None
+        raw_score, _ = score_alignment(ref["norm_pitch"], user_norm, ref_levels)
+        score = int(raw_score)
+        result.update(raw_score=round(float(raw_score), 3), audio_frames=len(user_norm))
+        if _worker["check_text"]:
+            text_correct, heard = _check_text(file_path, word_id)
+            if not text_correct:
+                score = max(0, score - 50)
+            result.update(text_correct=text_correct, heard_text=heard)
+        result["score"] = score
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+# --- INPUT ---
+def read_jobs(source):
+    if os.path.isdir(source):
+        for word_id in sorted(os.listdir(source)):
+            sub = os.path.join(source, word_id)
+            if not os.path.isdir(sub):
+                continue
+            for filename in sorted(os.listdir(sub)):
+                if filename.lower().endswith(AUDIO_EXTENSIONS):
+                    yield word_id, os.path.abspath(os.path.join(sub, filename))
+        return
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8", newline="") as f:
+        if source.endswith((".jsonl", ".json")):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            yield row["word_id"], os.path.join(base, row["file"])
+
+
+# --- OUTPUT ---
+class ResultWriter:
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.endswith(".csv")
+        self.done = self._read_done()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "a", encoding="utf-8", newline="")
+        if self.is_csv:
+            self._csv = csv.DictWriter(self._f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+            if new_file:
+                self._csv.writeheader()
+
+    def _read_done(self):
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            if self.is_csv:
+                rows = csv.DictReader(f)
+            else:
+                rows = []
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        continue  # partial last line from an interrupted run
+            for row in rows:
+                # Failures (undecodable file, sidecar down, ...) are retried on resume
+                if not row.get("error"):
+                    done.add((row["word_id"], row["file"]))
+        return done
+
+    def write(self, result):
+        if self.is_csv:
+            self._csv.writerow(result)
+        else:
+            self._f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of <word_id>/ folders or a CSV/JSONL manifest")
+    parser.add_argument("--out", required=True, help="results file (.jsonl or .csv); appended to and resumed")
+    parser.add_argument("--refs", default="References", help="reference recordings directory")
+    parser.add_argument("--store", default=refstore.DEFAULT_PATH, help="reference feature store")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--check-text", action="store_true", help="also run the Whisper content check")
+    parser.add_argument("--multires", action="store_true", help="use the coarse-to-fine aligner")
+    args = parser.parse_args()
+
+    # Build/refresh the store once in the parent; workers only map it
+    refstore.open_or_build(args.refs, args.store, analyze_reference, REF_FEATURE_VERSION,
+                           on_error=lambda name, e: print(f"❌ Failed to load {name}: {e}"), inputs=reference_inputs)
+
+    writer = ResultWriter(args.out)
+    jobs = ((w, p) for w, p in read_jobs(args.source) if (w, p) not in writer.done)
+    if writer.done:
+        print(f"↩️ Resuming: {len(writer.done)} recordings already scored")
+
+    start = time.perf_counter()
+    tally = {"scored": 0, "errors": 0, "score_sum": 0}
+
+    def collect(futures):
+        for future in futures:
+            result = future.result()
+            writer.write(result)
+            tally["scored"] += 1
+            if "error" in result:
+                tally["errors"] += 1
+            else:
+                tally["score_sum"] += result["score"]
+
+    max_pending = max(1, args.workers) * 4
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(args.store, args.check_text, args.multires)) as pool:
+            pending = set()
+            for word_id, path in jobs:
+                pending.add(pool.submit(score_one, word_id, path))
+                if len(pending) >= max_pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+            collect(wait(pending).done)
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted; re-run the same command to resume.")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    scored, errors = tally["scored"], tally["errors"]
+    print("\n" + "=" * 40)
+    print(f"📊 Scored: {scored} ({errors} errors) in {elapsed:.1f}s")
+    print(f"⚡ Throughput: {scored / elapsed if elapsed else 0:.2f} recordings/s with {args.workers} workers")
+    if scored > errors:
+        print(f"📈 Mean score: {tally['score_sum'] / (scored - errors):.1f}")
+    print(f"📝 Results: {args.out}")
+    print("=" * 40)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Curriculum catalog: phrase metadata defined once, shared by every voice.
+
+curriculum.jsonl holds one JSON object per line:
+
+    {"type": "phrase", "id": "Hello", "syllables": [...], "text": [...]}
+    {"type": "reference", "id": "HelloMale", "phrase": "Hello", "voice": "male"}
+
+A reference links a recording (word_id = file name without extension) to
+its phrase and may add "extra_text" accepted only for that recording.
+Adding vocabulary is a data change: append lines, drop the audio into the
+references folder, no code deploy.
+
+The file is opened on first use and only scanned for ids and byte offsets;
+an entry is parsed the first time it is looked up. Lookups are dict hits.
+"""
+import json
+import os
+import re
+import threading
+
+DEFAULT_PATH = os.environ.get(
+    "SEIKAKU_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "curriculum.jsonl")
+)
+
+# Lines written as {"type": ..., "id": ...} are indexed without a JSON parse
+_HEAD = re.compile(rb'^\s*\{\s*"type"\s*:\s*"(\w+)"\s*,\s*"id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class Catalog:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._offsets = None
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    # --- INDEX ---
+    def _index(self):
+        if self._offsets is not None:
+            return self._offsets
+        with self._lock:
+            if self._offsets is None:
+                offsets = {}
+                if os.path.exists(self.path):
+                    with open(self.path, "rb") as f:
+                        offset = 0
+                        for line in f:
+                            key = self._key(line)
+                            if key is not None:
+                                offsets[key] = offset
+                            offset += len(line)
+                self._offsets = offsets
+        return self._offsets
+
+    @staticmethod
+    def _key(line):
+        if not line.strip():
+            return None
+        m = _HEAD.match(line)
+        if m:
+            return m.group(1).decode(), json.loads(b'"' + m.group(2) + b'"')
+        entry = json.loads(line)
+        return entry["type"], entry["id"]
+
+    def _get(self, kind, entry_id):
+        key = (kind, entry_id)
+        if key in self._parsed:
+            return self._parsed[key]
+        offset = self._index().get(key)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            entry = json.loads(f.readline())
+        self._parsed[key] = entry
+        return entry
+
+    def reload(self):
+        with self._lock:
+            self._offsets = None
+            self._parsed = {}
+
+    # --- LOOKUPS ---
+    def phrase(self, phrase_id):
+        return self._get("phrase", phrase_id)
+
+    def reference(self, word_id):
+        return self._get("reference", word_id)
+
+    def phrase_id(self, word_id):
+        ref = self.reference(word_id)
+        return ref["phrase"] if ref else None
+
+    def syllables(self, word_id):
+        ref = self.reference(word_id)
+        phrase = self.phrase(ref["phrase"]) if ref else None
+        return phrase.get("syllables") if phrase else None
+
+    def expected_text(self, word_id):
+        ref = self.reference(word_id)
+        phrase = self.phrase(ref["phrase"]) if ref else None
+        if phrase is None:
+            return None
+        return phrase.get("text", []) + ref.get("extra_text", [])
+
+    def reference_ids(self):
+        return [entry_id for kind, entry_id in self._index() if kind == "reference"]
+
+
+CATALOG = Catalog()
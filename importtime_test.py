@@ -0,0 +1,74 @@
+"""Import-time budget for the server module.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and
+fails if importing takes longer than the budget or pulls in any of the
+heavy libraries that are meant to load lazily (inside the stages that use
+them, or in the background warm-up).
+
+    python -m pytest importtime_test.py
+    python importtime_test.py                  # with a per-module breakdown
+    SEIKAKU_IMPORT_BUDGET_MS=600 python importtime_test.py
+"""
+import os
+import subprocess
+import sys
+
+MODULE = "main"
+BUDGET_MS = float(os.environ.get("SEIKAKU_IMPORT_BUDGET_MS", "1000"))
+# Top-level packages that must not be imported by `import main`
+DEFERRED = ("whisper", "torch", "librosa", "numba", "matplotlib", "fastdtw", "scipy")
+
+
+def measure(module=MODULE):
+    """{module name: cumulative microseconds} as reported by -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"'import {module}' failed:\n{proc.stderr[-2000:]}")
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def problems(timings):
+    """Budget violations in a measure() result (empty when within budget)."""
+    found = []
+    loaded = sorted({name.split(".")[0] for name in timings} & set(DEFERRED))
+    if loaded:
+        found.append(f"Imported eagerly: {', '.join(loaded)}")
+    total_ms = timings.get(MODULE, 0) / 1000
+    if total_ms > BUDGET_MS:
+        found.append(f"import {MODULE} took {total_ms:.0f}ms, over budget by {total_ms - BUDGET_MS:.0f}ms")
+    return found
+
+
+def test_import_budget():
+    found = problems(measure())
+    assert not found, "; ".join(found)
+
+
+def main():
+    timings = measure()
+    total_ms = timings.get(MODULE, 0) / 1000
+    slowest = sorted(((us, name) for name, us in timings.items() if "." not in name and name != MODULE),
+                     reverse=True)[:5]
+
+    print(f"⏱️ import {MODULE}: {total_ms:.0f}ms (budget {BUDGET_MS:.0f}ms)")
+    for us, name in slowest:
+        print(f"   {name}: {us / 1000:.0f}ms")
+
+    found = problems(timings)
+    for problem in found:
+        print(f"❌ {problem}")
+    if found:
+        sys.exit(1)
+    print("✅ Import time within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,51 +10,15 @@ from fastdtw import fastdtw
 from scipy.signal import savgol_filter
 
 # --- 1. CONFIG ---
-SYLLABLE_MAP = {
-    # --- HELLO (Konnichiwa) ---
-    "HelloMale":   ["Ko", "n", "Ni", "Chi", "Wa"],
-    "HelloFemale": ["Ko", "n", "Ni", "Chi", "Wa"],
-
-    # --- YES (Hai) ---
-    "YesMale":   ["Ha", "i"],
-    "YesFemale": ["Ha", "i"],
-
-    # --- I / ME (Watashi) ---
-    "IMale":   ["Wa", "Ta", "Shi"],
-    "IFemale": ["Wa", "Ta", "Shi"],
-
-    # --- TO BE (Desu) ---
-    "BeMale":   ["De", "Su"],
-    "BeFemale": ["De", "Su"],
-
-    # --- TEACHER (Sensei) ---
-    "TeacherMale":   ["Se", "n", "Se", "i"],
-    "TeacherFemale": ["Se", "n", "Se", "i"],
-
-    # --- SENTENCE 1: "Yes, I am a teacher" ---
-    # Hai, watashi wa sensei desu
-    "YesIAmATeacherMale": [
-        "Ha", "i", "Wa", "Ta", "Shi", "Wa", "Se", "n", "Se", "i", "De", "Su"
-    ],
-    "YesIAmATeacherFemale": [
-        "Ha", "i", "Wa", "Ta", "Shi", "Wa", "Se", "n", "Se", "i", "De", "Su"
-    ],
-
-    # --- SENTENCE 2: "I am a student" ---
-    # Watashi wa gakusei desu
-    "IAmAStudentMale": [
-        "Wa", "Ta", "Shi", "Wa", "Ga", "Ku", "Se", "i", "De", "Su"
-    ],
-    "IAmAStudentFemale": [
-        "Wa", "Ta", "Shi", "Wa", "Ga", "Ku", "Se", "i", "De", "Su"
-    ]
-}
+# Syllable labels come from the shared curriculum catalog (curriculum.jsonl)
+from catalog import CATALOG
+
 # --- 2. HELPER FUNCTIONS ---
 def get_syllable_regions_automatic(path, word_id):
-    if word_id not in SYLLABLE_MAP:
+    labels = CATALOG.syllables(word_id)
+    if not labels:
         return []
 
-    labels = SYLLABLE_MAP[word_id]
     num_syllables = len(labels)
     total_ref_frames = path[-1][0]
     chunk_size = total_ref_frames / num_syllables
@@ -172,7 +136,7 @@ def compare_audio(teacher_file, student_file):
     ref_aligned = [ref_norm[i] for i, j in path]
     user_aligned = [user_norm[j] for i, j in path]
 
-    # Use "IMale" or "watashi" to match the SYLLABLE_MAP keys
+    # Use "IMale" to match a reference id in the catalog
     word_id = "IMale"
     regions = get_syllable_regions_automatic(path, word_id)
 
@@ -1,26 +1,33 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
 import os
-import io
-import base64
-import numpy as np
-import librosa
-import whisper
-from fastdtw import fastdtw
-from scipy.signal import savgol_filter
-from difflib import SequenceMatcher
+import re
+import tempfile
 from contextlib import asynccontextmanager
-import matplotlib
+import asyncio
 import time
-from fastapi.responses import FileResponse
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+import threading
+import admission
+import asr
+import metrics
+import payload
+import profiling
+import refstore
+from ref_index import ReferenceIndex
+from alignment import downsample_aligned, load_pyramid
+from pipeline import (MAX_PLOT_POINTS, REF_FEATURE_VERSION, analyze_reference, get_audio_duration,
+                      get_syllable_regions, match_expected_text, process_audio_file, reference_inputs,
+                      render_graph, score_alignment)
 import json
 import os
 from datetime import datetime, timedelta
 
 PROGRESS_FILE = "user_progress.json"
+# /analyze runs in worker threads; guards user_data updates and the file write
+progress_lock = threading.Lock()
 
 # Default state
 user_data = {
@@ -52,42 +59,129 @@ def save_progress():
     with open(PROGRESS_FILE, "w") as f:
         json.dump(user_data, f, indent=4)
 
-# Load immediately on startup
-load_progress()
-
 
 app = FastAPI()
 
 # --- CONFIG ---
 REF_DIR = "references"
 REF_CACHE = {}
-whisper_model = None
+# Packed, memory-mapped reference features shared by all workers (see refstore.py)
+REF_STORE_PATH = refstore.DEFAULT_PATH
+# Every reference grouped by phrase, for best-of-all-speakers matching
+REF_INDEX = ReferenceIndex()
+# Local Whisper model, unloaded after SEIKAKU_WHISPER_IDLE_SECONDS without use
+WHISPER = asr.ModelHolder()
+REF_STORE = None
+# Idle policy bookkeeping for the reference pages (the model tracks its own)
+idle_state = {"last_request": time.monotonic(), "references_released": 0, "references_resident": True}
+analyze_admission = admission.AdmissionController("analyze")
+# Set once the background warm-up has loaded references and Whisper
+startup_ready = None
+# Outcome of each warm-up step: "pending", "ok" or "failed: <error>"
+startup_state = {"references": "pending", "whisper": "pending", "prime": "pending"}
+# Steps /analyze cannot do without; a failed "prime" only costs the first request some latency
+REQUIRED_STEPS = ("references", "whisper")
 
 
 # --- LIFESPAN STARTUP ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 1. Load Reference Audio
+    load_progress()
+
+    # Heavy loading runs after the port is bound, so light endpoints answer
+    # straight away; /analyze waits for startup_ready.
+    global startup_ready
+    startup_ready = asyncio.Event()
+    warm_up_task = asyncio.create_task(warm_up())
+    reaper = asyncio.create_task(idle_reaper()) if WHISPER.idle_seconds > 0 else None
+    yield
+    warm_up_task.cancel()
+    if reaper is not None:
+        reaper.cancel()
+
+
+async def warm_up():
+    start = time.perf_counter()
+    # First pyin call JIT-compiles librosa's numba kernels, first graph loads matplotlib;
+    # prime_stages pays for both here rather than on a user's request
+    steps = (("references", load_references), ("whisper", load_whisper), ("prime", prime_stages))
+    try:
+        # Each step runs on its own, so one failure doesn't skip the others
+        for step, fn in steps:
+            try:
+                await run_in_threadpool(fn)
+                startup_state[step] = "ok"
+            except Exception as e:
+                metrics.record_error("warm_up", e)
+                startup_state[step] = f"failed: {type(e).__name__}: {e}"
+                print(f"❌ Warm-up step '{step}' failed: {e}")
+        print(f"🚀 Warm-up finished in {time.perf_counter() - start:.1f}s")
+    finally:
+        startup_ready.set()
+
+
+def startup_failure():
+    """Why /analyze can't run (a required warm-up step failed), or None."""
+    failed = [f"{step} {startup_state[step]}" for step in REQUIRED_STEPS if startup_state[step].startswith("failed")]
+    return "; ".join(failed) or None
+
+
+def load_references():
+    # Mapped from the shared store, built on first run
     if not os.path.exists(REF_DIR):
         os.makedirs(REF_DIR)
-    else:
-        for filename in os.listdir(REF_DIR):
-            if filename.endswith(".wav") or filename.endswith(".mp3"):
-                word_id = os.path.splitext(filename)[0]
-                path = os.path.join(REF_DIR, filename)
-                try:
-                    norm_pitch = process_audio_file(path)
-                    REF_CACHE[word_id] = {"norm_pitch": norm_pitch}
-                    print(f"✅ Loaded Reference: {word_id}")
-                except Exception as e:
-                    print(f"❌ Failed to load {filename}: {e}")
-
-    # 2. Load Whisper
-    print("🎧 Loading Whisper Model (Small)...")
-    global whisper_model
-    whisper_model = whisper.load_model("small")
+
+    def on_error(filename, e):
+        metrics.record_error("reference_load", e)
+        print(f"❌ Failed to load {filename}: {e}")
+
+    store, rebuilt = refstore.open_or_build(REF_DIR, REF_STORE_PATH, analyze_reference,
+                                            REF_FEATURE_VERSION, on_error=on_error, inputs=reference_inputs)
+    REF_CACHE.update(store.as_cache())
+    global REF_INDEX, REF_STORE
+    REF_STORE = store
+    REF_INDEX = ReferenceIndex.from_cache(REF_CACHE)
+    for word_id in REF_CACHE:
+        print(f"✅ Loaded Reference: {word_id}")
+    print(f"📦 Reference store {'rebuilt' if rebuilt else 'mapped'}: {REF_STORE_PATH}")
+    metrics.REFERENCES_LOADED.set(len(REF_CACHE))
+
+
+def load_whisper():
+    # Skipped when workers share the sidecar's model
+    if asr.SIDECAR_SOCKET:
+        print(f"🎧 Using Whisper Model ({asr.describe()})")
+        return
+    print(f"🎧 Loading Whisper Model ({asr.describe()})...")
+    WHISPER.load()
     print("✅ Whisper Ready.")
-    yield
+
+
+def prime_stages():
+    sources = refstore.list_sources(REF_DIR)
+    if not sources:
+        return
+    word_id, source = next(iter(sources.items()))
+    contour = process_audio_file(os.path.join(REF_DIR, source["file"]))
+    render_graph(contour, contour, [], word_id)
+    from fastdtw import fastdtw  # noqa: F401
+
+
+async def idle_reaper():
+    """Drops the Whisper model and the reference pages after a quiet period.
+
+    Both come back on the next request: the model is reloaded (and warmed
+    up) by WHISPER.run, the pages fault back in from the store file.
+    """
+    while True:
+        await asyncio.sleep(WHISPER.check_interval)
+        if not asr.SIDECAR_SOCKET and await run_in_threadpool(WHISPER.unload_if_idle):
+            print(f"💤 Whisper unloaded after {WHISPER.idle_seconds:.0f}s idle")
+        quiet = time.monotonic() - idle_state["last_request"]
+        if REF_STORE is not None and idle_state["references_resident"] and quiet >= WHISPER.idle_seconds:
+            REF_STORE.release()
+            idle_state["references_resident"] = False
+            idle_state["references_released"] += 1
 
 
 app = FastAPI(lifespan=lifespan)
@@ -99,166 +193,71 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- MAPS ---
-SYLLABLE_MAP = {
-    "HelloMale": ["Ko", "n", "Ni", "Chi", "Wa"],
-    "HelloFemale": ["Ko", "n", "Ni", "Chi", "Wa"],
-    "YesMale": ["Ha", "i"],
-    "YesFemale": ["Ha", "i"],
-    "IMale": ["Wa", "Ta", "Shi"],
-    "IFemale": ["Wa", "Ta", "Shi"],
-    "BeMale": ["De", "Su"],
-    "BeFemale": ["De", "Su"],
-    "TeacherMale": ["Se", "n", "Se", "i"],
-    "TeacherFemale": ["Se", "n", "Se", "i"],
-    "YesIAmATeacherMale": ["Ha", "i", "Wa", "Ta", "Shi", "Wa", "Se", "n", "Se", "i", "De", "Su"],
-    "YesIAmATeacherFemale": ["Ha", "i", "Wa", "Ta", "Shi", "Wa", "Se", "n", "Se", "i", "De", "Su"],
-    "IAmAStudentMale": ["Wa", "Ta", "Shi", "Wa", "Ga", "Ku", "Se", "i", "De", "Su"],
-    "IAmAStudentFemale": ["Wa", "Ta", "Shi", "Wa", "Ga", "Ku", "Se", "i", "De", "Su"]
-}
-
-EXPECTED_TEXT_MAP = {
-    "HelloMale": ["konnichiwa", "hello", "こんにちは", "こんにちわ"],
-    "HelloFemale": ["konnichiwa", "hello", "こんにちは", "こんにちわ"],
-    "YesMale": ["hai", "hi", "yes", "はい"],
-    "YesFemale": ["hai", "hi", "yes", "はい"],
-    "IMale": ["watashi", "watashiwa", "私", "わたし"],
-    "IFemale": ["watashi", "watashiwa", "私", "わたし"],
-    "BeMale": ["desu", "dess", "です"],
-    "BeFemale": ["desu", "dess", "です"],
-    "TeacherMale": ["sensei", "sensay", "先生", "せんせい"],
-    "TeacherFemale": ["sensei", "sensay", "先生", "せんせい"],
-    "YesIAmATeacherMale": ["hai watashi wa sensei desu", "i am a teacher", "はい私は先生です",
-                           "はいわたしはせんせいです", "はい、私は先生です"],
-    "YesIAmATeacherFemale": ["hai watashi wa sensei desu", "はい私は先生です", "はいわたしはせんせいです",
-                             "はい、私は先生です"],
-    "IAmAStudentMale": ["watashi wa gakusei desu", "i am a student", "私は学生です", "わたしはがくせいです"],
-    "IAmAStudentFemale": ["watashi wa gakusei desu", "私は学生です", "わたしはがくせいです"]
-}
 
-# --- HELPERS ---
-def check_for_silence(file_path):
-    """Returns True if the audio is basically silent."""
-    try:
-        y, sr = librosa.load(file_path, sr=16000, mono=True)
-        rms = librosa.feature.rms(y=y)
-        if rms.mean() < 0.005:
-            return True
-        return False
-    except:
-        return True
-
-
-def process_audio_file(file_path):
-    try:
-        y, sr = librosa.load(file_path, sr=22050, mono=True)
-        y_trimmed, _ = librosa.effects.trim(y, top_db=25)
-        f0, _, _ = librosa.pyin(y_trimmed, fmin=50, fmax=400, sr=sr)
-        f0 = np.nan_to_num(f0)
-        valid_pitch = f0[f0 > 0]
-        if len(valid_pitch) == 0: return np.zeros(100)
-        mean = np.mean(valid_pitch)
-        std = np.std(valid_pitch)
-        norm_pitch = (f0 - mean) / (std + 1e-6)
-        norm_pitch[f0 < 1] = 0
+# --- CONTENT CHECK ---
+def validate_speech_content(audio_path, word_id):
+    if asr.SIDECAR_SOCKET:
         try:
-            norm_pitch = savgol_filter(norm_pitch, 21, 2)
-        except:
-            pass
-        return norm_pitch
-    except:
-        return np.zeros(100)
-
+            return match_expected_text(asr.transcribe_remote(audio_path), word_id)
+        except (OSError, ValueError, RuntimeError) as e:
+            # Sidecar down or busy: skip the content check like a missing model
+            metrics.record_error("asr_sidecar", e)
+            print(f"⚠️ Whisper sidecar unavailable: {e}")
+            return True, ""
 
-def validate_speech_content(audio_path, word_id):
-    if whisper_model is None: return True, ""
-
-    result = whisper_model.transcribe(
-        audio_path,
-        language="ja",
-        fp16=False,
-        initial_prompt="これは日本語の授業です。",
-
-        # --- ANTI-LOOP & SPEED SETTINGS ---
-        temperature=0.0,
-        beam_size=1,
-        best_of=1,
-        compression_ratio_threshold=1.8,
-        no_speech_threshold=0.6,
-        condition_on_previous_text=False,
-        logprob_threshold=-1.0
-    )
-
-    text = result["text"].lower().strip()
-
-    # --- MANUAL REPETITION CLEANER ---
-    #please just stop looping
-    if len(text) > 50:
-        text = text[:20]
-        print(f"⚠️ Truncated repetition loop: {text}...")
-
-    text = text.replace("。", "").replace("、", "").replace("!", "").replace("?", "")
-
-    if word_id not in EXPECTED_TEXT_MAP: return True, text
-
-    allowed = EXPECTED_TEXT_MAP[word_id]
-
-    # Exact Match
-    for phrase in allowed:
-        if phrase in text: return True, text
-
-    # Fuzzy Match
-    best_ratio = 0.0
-    for phrase in allowed:
-        ratio = SequenceMatcher(None, phrase, text).ratio()
-        if ratio > best_ratio: best_ratio = ratio
-
-    if best_ratio > 0.6:
-        return True, text
-
-    return False, text
-
-def get_syllable_regions(path, word_id):
-    if word_id not in SYLLABLE_MAP: return []
-    labels = SYLLABLE_MAP[word_id]
-    if len(path) == 0: return []
-    chunk_size = path[-1][0] / len(labels)
-    regions = []
-    last_idx = 0
-    for i, label in enumerate(labels):
-        target = int((i + 1) * chunk_size)
-        curr_idx = len(path) - 1
-        for k, (ref_idx, _) in enumerate(path):
-            if ref_idx >= target:
-                curr_idx = k
-                break
-        regions.append({"label": label, "start_index": last_idx, "end_index": curr_idx})
-        last_idx = curr_idx
-    return regions
-
-
-def generate_graph(ref, user, regions, word_id):
-    plt.figure(figsize=(10, 5))
-    colors = ['#e6f2ff', '#fff0e6', '#e6ffe6']
-    for i, r in enumerate(regions):
-        plt.axvspan(r['start_index'], r['end_index'], color=colors[i % 3], alpha=0.5)
-        plt.text((r['start_index'] + r['end_index']) / 2, 2.2, r['label'], ha='center', weight='bold')
-    plt.plot(ref, 'g', linewidth=3, label='Teacher')
-    plt.plot(user, 'r--', linewidth=3, label='You')
-    plt.ylim(-3, 3)
-    plt.legend()
-    plt.title(f"Pronunciation: {word_id}")
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    plt.close()
-    buf.seek(0)
-    return base64.b64encode(buf.getvalue()).decode('utf-8')
+    # Never skipped: /analyze is refused (503) when the local model failed to load
+    text = WHISPER.run(asr.transcribe, audio_path)
+    return match_expected_text(text, word_id)
 
 
 # --- ENDPOINTS ---
 @app.get("/")
 async def home():
-    return {"message": "Server is Online! Send POST requests to /analyze"}
+    return {"message": "Server is Online! Send POST requests to /analyze",
+            "ready": startup_ready is not None and startup_ready.is_set() and startup_failure() is None,
+            "startup": startup_state}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/admission")
+async def get_admission_stats():
+    return analyze_admission.stats()
+
+
+@app.get("/admin/idle")
+async def get_idle_stats():
+    quiet = time.monotonic() - idle_state["last_request"]
+    return {
+        "whisper": None if asr.SIDECAR_SOCKET else WHISPER.stats(),
+        "references": {
+            "resident": idle_state["references_resident"],
+            "released": idle_state["references_released"],
+            "idle_seconds": round(quiet, 1),
+        },
+    }
+
+
+@app.get("/admin/profiling")
+async def set_profiling(sample_rate: float = None, force_next: int = None):
+    # e.g. /admin/profiling?sample_rate=0.05 or /admin/profiling?force_next=3
+    return profiling.configure(sample_rate=sample_rate, force_next=force_next)
+
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    return profiling.list_profiles()
+
+
+@app.get("/admin/profiles/{name}")
+async def download_profile(name: str):
+    path = profiling.profile_path(name)
+    if path is None or not os.path.exists(path):
+        return {"error": f"Profile '{name}' not found."}
+    return FileResponse(path, media_type="application/octet-stream", filename=name + ".pstats")
 
 
 @app.get("/admin/reset-to-demo")
@@ -342,30 +341,102 @@ async def get_user_stats():
 
 @app.post("/analyze")
 async def analyze_pitch(
+        request: Request,
         word_id: str = Form(...),
-        file: UploadFile = File(...)
+        file: UploadFile = File(...),
+        best_match: bool = Form(False),
+        multires: bool = Form(False),
+        graph: bool = Form(True)
 ):
-    start_time = time.time()
-    temp_filename = f"temp_{file.filename}"
+    try:
+        queue_wait = await analyze_admission.acquire(request.is_disconnected)
+    except admission.Overloaded as e:
+        print(f"🚦 Shedding /analyze: {analyze_admission.stats()}")
+        return JSONResponse(status_code=503, headers={"Retry-After": str(e.retry_after)},
+                            content={"error": "Server is busy. Please try again shortly.",
+                                     "retry_after": e.retry_after})
+    except admission.ClientGone:
+        # Nobody is waiting for the answer; don't spend CPU on it
+        return JSONResponse(status_code=499, content={"error": "Client disconnected."})
+
+    idle_state["last_request"] = time.monotonic()
+    idle_state["references_resident"] = True
+    metrics.STAGE_SECONDS.observe(queue_wait, "queue_wait")
+    metrics.IN_FLIGHT.inc("analyze")
+    start = time.perf_counter()
+    try:
+        # Right after a restart references and Whisper may still be loading
+        if startup_ready is not None:
+            await startup_ready.wait()
+        failure = startup_failure()
+        if failure is not None:
+            # Scoring without references or the content check would hand out wrong scores and streaks
+            return JSONResponse(status_code=503, content={"error": f"Server is not ready: {failure}."})
+        # CPU-bound work runs off the event loop so queued requests can be admitted and shed
+        # Curves go out in MessagePack, or in any format when the client opted out of the PNG
+        curves = not graph or payload.negotiate(request.headers.get("accept")) == payload.MSGPACK
+        return await run_in_threadpool(_run_analysis, word_id, file, queue_wait,
+                                       {"best_match": best_match, "multires": multires, "graph": graph,
+                                        "curves": curves},
+                                       request.headers.get("accept"), request.headers.get("accept-encoding"))
+    finally:
+        metrics.IN_FLIGHT.dec("analyze")
+        analyze_admission.release(time.perf_counter() - start)
+
+
+def _run_analysis(word_id, file, queue_wait, options, accept=None, accept_encoding=None):
+    with metrics.request_scope() as spans:
+        profile_meta = {"word_id": word_id, "stage_times": spans}
+        with profiling.profile_request(profile_meta) as profile_meta:
+            result = _analyze(word_id, file, spans, profile_meta, queue_wait, options)
+            # JSON (default), multipart with the raw PNG, or MessagePack; see payload.py
+            with metrics.span("serialize"):
+                return payload.encode(result, accept, accept_encoding)
 
-    with open(temp_filename, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+
+def _analyze(word_id, file, spans, profile_meta=None, queue_wait=0.0, options=None):
+    options = options or {}
+    start_time = time.time()
+    # Unique per request: concurrent uploads often share a client file name (recording.wav),
+    # and the name must not decide where we write. Only a plain extension is kept for the decoders.
+    suffix = os.path.splitext(file.filename or "")[1]
+    if not re.fullmatch(r"\.[A-Za-z0-9]{1,8}", suffix):
+        suffix = ""
+
+    with metrics.span("upload"):
+        with tempfile.NamedTemporaryFile("wb", prefix="seikaku_", suffix=suffix, delete=False) as buffer:
+            temp_filename = buffer.name
+            shutil.copyfileobj(file.file, buffer)
+    if profile_meta is not None:
+        profile_meta["audio_seconds"] = get_audio_duration(temp_filename)
 
     try:
         # 1. VALIDATE SPEECH CONTENT (Whisper)
-        is_text_correct, heard_text = validate_speech_content(temp_filename, word_id)
+        with metrics.span("whisper"):
+            is_text_correct, heard_text = validate_speech_content(temp_filename, word_id)
 
         # 2. CHECK REFERENCE CACHE
+        metrics.record_cache("reference", word_id in REF_CACHE)
         if word_id not in REF_CACHE:
             return {"error": f"Reference audio for '{word_id}' not found."}
 
         # 3. EXTRACT PITCH & ALIGN (DTW)
-        ref_norm = REF_CACHE[word_id]["norm_pitch"]
-        user_norm = process_audio_file(temp_filename)
-        dist, path = fastdtw(ref_norm, user_norm, dist=lambda x, y: abs(x - y))
+        with metrics.span("pitch"):
+            user_norm = process_audio_file(temp_filename)
+
+        # Optionally score against the closest native speaker of the same phrase
+        matched_id = word_id
+        if options.get("best_match"):
+            with metrics.span("search"):
+                matched_id, _, search_stats = REF_INDEX.search(user_norm, word_id)
+            print(f"🔎 Best reference for {word_id}: {matched_id} ({search_stats})")
+        ref_entry = REF_CACHE[matched_id]
+        ref_norm = ref_entry["norm_pitch"]
+        # Multi-resolution mode reuses the reference's precomputed pyramid
+        ref_levels = load_pyramid(ref_entry) if options.get("multires") else None
+        raw_score, path = score_alignment(ref_norm, user_norm, ref_levels)
 
         # 4. CALCULATE SCORE
-        raw_score = max(0, 100 - (dist / len(path) * 25))
         final_score = int(raw_score)
 
         feedback_msg = "Great pronunciation!"
@@ -376,46 +447,73 @@ async def analyze_pitch(
         # 5. GENERATE VISUAL FEEDBACK
         ref_aligned = [ref_norm[i] for i, j in path]
         user_aligned = [user_norm[j] for i, j in path]
-        regions = get_syllable_regions(path, word_id)
-        graph = generate_graph(ref_aligned, user_aligned, regions, word_id)
+        with metrics.span("regions"):
+            regions = get_syllable_regions(path, matched_id, ref_entry.get("syllable_bounds"))
+        if options.get("multires"):
+            ref_aligned, user_aligned, regions = downsample_aligned(ref_aligned, user_aligned, regions,
+                                                                   MAX_PLOT_POINTS)
+        # Clients drawing from the returned curves can skip the server-side PNG
+        graph = None
+        if options.get("graph", True):
+            with metrics.span("graph"):
+                graph = render_graph(ref_aligned, user_aligned, regions, matched_id)
+        # Curves for clients that draw the graph themselves
+        curves = None
+        if options.get("curves"):
+            curve_ref, curve_user, curve_regions = downsample_aligned(ref_aligned, user_aligned, regions,
+                                                                      MAX_PLOT_POINTS)
+            curves = {"ref": curve_ref, "user": curve_user, "regions": curve_regions}
 
         # 6. UPDATE GLOBAL STATS & PERSISTENCE
-        user_data["scores_history"].append(final_score)
-        if len(user_data["scores_history"]) > 50:
-            user_data["scores_history"].pop(0)
-
-        # Only award streak progress for successful attempts
-        if is_text_correct and final_score > 70:
-            today = datetime.now().date()
-            yesterday = today - timedelta(days=1)
-
-            last_date_str = user_data.get("last_practice_date")
-            last_date = datetime.strptime(last_date_str, "%Y-%m-%d").date() if last_date_str else None
-
-            if last_date == yesterday:
-                user_data["current_streak"] += 1
-            elif last_date != today:
-                # If they missed a day, reset. If they already practiced today, do nothing.
-                user_data["current_streak"] = 1
-
-            user_data["last_practice_date"] = today.strftime("%Y-%m-%d")
-            user_data["total_sessions"] += 1
-            user_data["best_streak"] = max(user_data["best_streak"], user_data["current_streak"])
-            save_progress()
+        with progress_lock:
+            user_data["scores_history"].append(final_score)
+            if len(user_data["scores_history"]) > 50:
+                user_data["scores_history"].pop(0)
+
+            # Only award streak progress for successful attempts
+            if is_text_correct and final_score > 70:
+                today = datetime.now().date()
+                yesterday = today - timedelta(days=1)
+
+                last_date_str = user_data.get("last_practice_date")
+                last_date = datetime.strptime(last_date_str, "%Y-%m-%d").date() if last_date_str else None
+
+                if last_date == yesterday:
+                    user_data["current_streak"] += 1
+                elif last_date != today:
+                    # If they missed a day, reset. If they already practiced today, do nothing.
+                    user_data["current_streak"] = 1
+
+                user_data["last_practice_date"] = today.strftime("%Y-%m-%d")
+                user_data["total_sessions"] += 1
+                user_data["best_streak"] = max(user_data["best_streak"], user_data["current_streak"])
+                with metrics.span("persist"):
+                    save_progress()
+
+            current_streak = user_data["current_streak"]
+            user_average = round(sum(user_data["scores_history"]) / len(user_data["scores_history"]), 1)
 
         duration = round(time.time() - start_time, 2)
-        print(f"⏱️ RESPONSE: {duration}s | Score: {final_score} | Streak: {user_data['current_streak']}")
+        metrics.REQUEST_SECONDS.observe(time.time() - start_time, "analyze")
+        print(f"⏱️ RESPONSE: {duration}s (queued {queue_wait:.2f}s) | Score: {final_score} | Streak: {current_streak} | Stages: {spans}")
 
-        return {
+        result = {
             "score": final_score,
             "feedback": feedback_msg,
+            "matched_reference": matched_id,
             "graph_image": graph,
             "processing_time": f"{duration}s",
-            "current_streak": user_data["current_streak"],
-            "user_average": round(sum(user_data["scores_history"]) / len(user_data["scores_history"]), 1)
+            "queue_time": f"{round(queue_wait, 2)}s",
+            "stage_times": spans,
+            "current_streak": current_streak,
+            "user_average": user_average,
         }
+        if curves is not None:
+            result["curves"] = curves
+        return result
 
     except Exception as e:
+        metrics.record_error("analyze", e)
         print(f"❌ ERROR: {e}")
         return {"error": "Processing failed. Check audio quality."}
 
@@ -425,4 +523,4 @@ async def analyze_pitch(
 if __name__ == "__main__":
     import uvicorn
 
-uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000)
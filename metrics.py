@@ -0,0 +1,180 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# --- CONFIG ---
+# Latency buckets in seconds. Whisper on CPU sits in the 1-10s range, the
+# pitch/DTW stages in the 10ms-1s range, so the buckets cover both.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_REGISTRY = []
+
+# Stage timings for the request currently being handled (None outside a request)
+_request_spans = ContextVar("request_spans", default=None)
+
+
+# --- METRIC TYPES ---
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        _REGISTRY.append(self)
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {label_values}")
+        return tuple(str(v) for v in label_values)
+
+    def _label_str(self, key, extra=None):
+        pairs = list(zip(self.labels, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + body + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{self._label_str(key)} {_fmt(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *label_values):
+        return self._values.get(self._key(label_values), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def get(self, *label_values):
+        return self._values.get(self._key(label_values), 0)
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram: one bisect and three adds per observation."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        key = self._key(label_values)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self._values.items())
+        for key, (counts, total, count) in items:
+            running = 0
+            for bound, c in zip(self.buckets, counts):
+                running += c
+                lines.append(f"{self.name}_bucket{self._label_str(key, ('le', _fmt(bound)))} {running}")
+            lines.append(f"{self.name}_bucket{self._label_str(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# --- METRICS ---
+STAGE_SECONDS = Histogram("seikaku_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("seikaku_request_seconds", "End-to-end request latency.", ("endpoint",))
+IN_FLIGHT = Gauge("seikaku_requests_in_flight", "Requests currently being processed.", ("endpoint",))
+QUEUE_DEPTH = Gauge("seikaku_queue_depth", "Requests waiting for a processing slot.", ("endpoint",))
+CACHE_LOOKUPS = Counter("seikaku_cache_lookups_total", "Cache lookups by result.", ("cache", "result"))
+ERRORS = Counter("seikaku_errors_total", "Errors by where they happened and exception type.", ("where", "cause"))
+WHISPER_LOAD_SECONDS = Gauge("seikaku_whisper_load_seconds", "Time taken by the last Whisper model load.")
+REFERENCES_LOADED = Gauge("seikaku_references_loaded", "Reference contours held in the cache.")
+
+
+# --- HELPERS ---
+@contextmanager
+def request_scope():
+    """Collects the spans of one request; yields the {stage: seconds} dict."""
+    spans = {}
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+@contextmanager
+def span(stage):
+    """Times a block into STAGE_SECONDS and the current request's spans."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans[stage] = round(spans.get(stage, 0.0) + elapsed, 4)
+
+
+def record_error(where, exc):
+    ERRORS.inc(where, type(exc).__name__)
+
+
+def record_cache(cache, hit):
+    CACHE_LOOKUPS.inc(cache, "hit" if hit else "miss")
+
+
+def render():
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
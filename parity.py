@@ -0,0 +1,346 @@
+"""Accuracy parity of the fast modes against the reference pipeline.
+
+The baseline is what students were scored with before any speed-up:
+process_audio_file + fastdtw for the score, and Whisper small/fp32 with the
+original SequenceMatcher rule (phrase in text, or ratio > 0.6) for the
+content check. Every fast mode is run on the same recordings and compared:
+
+  score modes   multires (coarse-to-fine DTW), best_match (closest speaker)
+  text modes    text_index (canonical kana/romaji matcher), whisper_batch
+                (the sidecar's batched decode), each extra Whisper tier/precision
+
+Only text_index is compared against the original rule. whisper_batch and
+the tiers are compared against small/fp32 scored with the same indexed
+matcher (the text_index rows), so their flips are model drift alone.
+
+Recordings are the bundled references, each checked as every other voice
+of the same phrase (IMale.wav as IFemale: should be accepted) and as every
+reference of the other phrases (IMale.wav as HelloMale: should be
+rejected), plus an optional corpus of user recordings (<word_id>/ folders
+or a CSV/JSONL manifest, as in bulk_score.py; no expected verdict).
+
+For each mode the report shows the mean and max |score delta|, how many
+verdicts flip (accept/reject for text, the > 70 streak threshold for
+scores), false accepts/rejects on the labelled recordings, and the
+per-recording latency of the stage the mode replaces. best_match is
+reported as untested when no search had more than one candidate voice.
+Exits with status 1 when a mode exceeds its tolerances.
+
+    python parity.py --refs References
+    python parity.py --corpus recordings/ --text --models base tiny --out parity.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from difflib import SequenceMatcher
+
+import refstore
+from alignment import load_pyramid
+from bulk_score import read_jobs
+from catalog import CATALOG
+from pipeline import (REF_FEATURE_VERSION, analyze_reference, match_expected_text, process_audio_file,
+                      reference_inputs, score_alignment)
+from ref_index import ReferenceIndex, phrase_of
+
+# --- CONFIG ---
+# Streaks only advance on attempts scoring above this (see main._analyze)
+STREAK_THRESHOLD = 70
+LEGACY_FUZZY_RATIO = 0.6
+# Per mode: mean and max |score delta| in points, share of flipped verdicts
+TOLERANCES = {
+    "multires": {"mean_delta": 2.0, "max_delta": 8, "flip_rate": 0.05},
+    # Scoring against another speaker is a deliberate change; only guard against gross drift
+    "best_match": {"mean_delta": 15.0, "max_delta": 40, "flip_rate": 0.30},
+    # Text modes are also held to a false-accept rate on the cross-phrase recordings, both
+    # absolute and relative to the baseline (I am a student vs Yes, I am a teacher is accepted by both)
+    "text_index": {"flip_rate": 0.10, "false_accept_rate": 0.10, "false_accept_increase": 0.02},
+    "whisper_batch": {"flip_rate": 0.05, "false_accept_rate": 0.10, "false_accept_increase": 0.02},
+    "whisper": {"flip_rate": 0.10, "false_accept_rate": 0.10, "false_accept_increase": 0.02},
+}
+
+
+def legacy_text_match(text, word_id):
+    """The content check as it was before the indexed matcher (text already cleaned)."""
+    allowed = CATALOG.expected_text(word_id)
+    if allowed is None:
+        return True
+    if any(phrase in text for phrase in allowed):
+        return True
+    return max((SequenceMatcher(None, phrase, text).ratio() for phrase in allowed), default=0.0) > LEGACY_FUZZY_RATIO
+
+
+# --- INPUT ---
+def _expected(word_id, own_id):
+    if phrase_of(word_id) == phrase_of(own_id):
+        return True
+    texts, spoken = CATALOG.expected_text(word_id), CATALOG.expected_text(own_id)
+    if any(a in b or b in a for a in texts for b in spoken):
+        return None
+    return False
+
+
+def reference_items(ref_dir):
+    """(word_id, path, own reference id, expected accept) for every reference checked as every other one.
+
+    Same phrase, other voice: expected True. Another phrase: expected False,
+    unless one phrase's text contains the other's (はい in はい、わたしは...),
+    which is left unlabelled.
+    """
+    refs = [(word_id, os.path.join(ref_dir, source["file"]))
+            for word_id, source in refstore.list_sources(ref_dir).items()
+            if CATALOG.phrase_id(word_id) is not None]
+    items = []
+    for own_id, path in refs:
+        for word_id, _ in refs:
+            if word_id != own_id:
+                items.append((word_id, path, own_id, _expected(word_id, own_id)))
+    return items
+
+
+# --- SCORE MODES ---
+def run_scores(items, cache):
+    """{mode: [{"score", "seconds"} per item]}; seconds cover alignment (and search), not pitch extraction."""
+    indexes = {}
+
+    def index_without(own_id):
+        # A reference must not be matched against its own recording
+        if own_id not in indexes:
+            indexes[own_id] = ReferenceIndex.from_cache({w: e for w, e in cache.items() if w != own_id})
+        return indexes[own_id]
+
+    contours = {}
+    results = {"baseline": [], "multires": [], "best_match": []}
+    for n, (word_id, path, own_id, _) in enumerate(items, 1):
+        ref = cache.get(word_id)
+        if ref is None:
+            for rows in results.values():
+                rows.append(None)
+            continue
+        # Pitch extraction is shared: no mode changes the tracker
+        if path not in contours:
+            contours[path] = process_audio_file(path)
+        user_norm = contours[path]
+
+        start = time.perf_counter()
+        raw, _ = score_alignment(ref["norm_pitch"], user_norm)
+        results["baseline"].append({"score": int(raw), "seconds": time.perf_counter() - start})
+
+        start = time.perf_counter()
+        raw, _ = score_alignment(ref["norm_pitch"], user_norm, load_pyramid(ref))
+        results["multires"].append({"score": int(raw), "seconds": time.perf_counter() - start})
+
+        start = time.perf_counter()
+        matched_id, _, stats = index_without(own_id).search(user_norm, word_id)
+        raw, _ = score_alignment(cache[matched_id]["norm_pitch"], user_norm)
+        results["best_match"].append({"score": int(raw), "seconds": time.perf_counter() - start,
+                                      "matched": matched_id, "candidates": stats["candidates"]})
+        print(f"\r📐 Scored {n}/{len(items)}", end="", flush=True)
+    print()
+    return results
+
+
+# --- TEXT MODES ---
+def transcribe_all(items, name, precision, batched=False):
+    import asr
+
+    model = asr.load_model(name, precision)
+    paths = sorted({path for _, path, _, _ in items})
+    texts, seconds = {}, {}
+    if batched:
+        from asr_sidecar import BATCH_MAX
+        for i in range(0, len(paths), BATCH_MAX):
+            chunk = paths[i:i + BATCH_MAX]
+            start = time.perf_counter()
+            results = asr.transcribe_batch(model, chunk)
+            per_clip = (time.perf_counter() - start) / len(chunk)
+            for path, result in zip(chunk, results):
+                texts[path] = "" if isinstance(result, Exception) else result
+                seconds[path] = per_clip
+    else:
+        for path in paths:
+            start = time.perf_counter()
+            texts[path] = asr.transcribe(model, path)
+            seconds[path] = time.perf_counter() - start
+    return texts, seconds
+
+
+def verdicts(items, texts, seconds, legacy=False):
+    rows = []
+    for word_id, path, _, _ in items:
+        accepted, heard = match_expected_text(texts[path], word_id)
+        if legacy:
+            accepted = legacy_text_match(heard, word_id)
+        rows.append({"accepted": accepted, "heard": heard, "seconds": seconds[path]})
+    return rows
+
+
+def run_text(items, models, precisions):
+    """{mode: rows}; the text_index rows double as the baseline of the model modes."""
+    print("🎧 small / fp32 (baseline) ...")
+    texts, seconds = transcribe_all(items, "small", "fp32")
+    results = {
+        "baseline": verdicts(items, texts, seconds, legacy=True),
+        "text_index": verdicts(items, texts, seconds),
+    }
+    print("🎧 small / fp32, batched ...")
+    results["whisper_batch"] = verdicts(items, *transcribe_all(items, "small", "fp32", batched=True))
+    for name in models:
+        for precision in precisions:
+            if (name, precision) == ("small", "fp32"):
+                continue
+            print(f"🎧 {name} / {precision} ...")
+            results[f"whisper_{name}_{precision}"] = verdicts(items, *transcribe_all(items, name, precision))
+    return results
+
+
+# --- REPORT ---
+def compare(mode, baseline, rows, items, kind):
+    pairs = [(b, r, item) for b, r, item in zip(baseline, rows, items) if b is not None and r is not None]
+    if not pairs:
+        return None
+    if kind == "score":
+        deltas = [r["score"] - b["score"] for b, r, _ in pairs]
+        flips = [(b, r, item) for b, r, item in pairs
+                 if (b["score"] > STREAK_THRESHOLD) != (r["score"] > STREAK_THRESHOLD)]
+    else:
+        deltas = []
+        flips = [(b, r, item) for b, r, item in pairs if b["accepted"] != r["accepted"]]
+    base_seconds = sum(b["seconds"] for b, _, _ in pairs) / len(pairs)
+    mode_seconds = sum(r["seconds"] for _, r, _ in pairs) / len(pairs)
+    report = {
+        "mode": mode,
+        "kind": kind,
+        "recordings": len(pairs),
+        "mean_delta": round(sum(abs(d) for d in deltas) / len(deltas), 2) if deltas else None,
+        "max_delta": max((abs(d) for d in deltas), default=None),
+        "bias": round(sum(deltas) / len(deltas), 2) if deltas else None,
+        "flips": len(flips),
+        "flip_rate": round(len(flips) / len(pairs), 3),
+        "baseline_ms": round(base_seconds * 1000, 1),
+        "mode_ms": round(mode_seconds * 1000, 1),
+        "speedup": round(base_seconds / mode_seconds, 2) if mode_seconds else None,
+        "flipped": [{"word_id": item[0], "file": item[1], "baseline": b, "mode": r} for b, r, item in flips],
+    }
+    if kind == "text":
+        report.update(_labelled(pairs))
+    if mode == "best_match":
+        # With a single voice per phrase the search can only return the requested reference
+        report["searched"] = sum(r.get("candidates", 0) > 1 for _, r, _ in pairs)
+        report["untested"] = report["searched"] == 0
+    return report
+
+
+def _labelled(pairs):
+    """False accepts (expected reject) and false rejects (expected accept), mode and baseline."""
+    negatives = [(b, r) for b, r, item in pairs if item[3] is False]
+    positives = [(b, r) for b, r, item in pairs if item[3] is True]
+    stats = {"negatives": len(negatives), "positives": len(positives)}
+    for prefix, pick in (("", 1), ("baseline_", 0)):
+        false_accepts = sum(pair[pick]["accepted"] for pair in negatives)
+        false_rejects = sum(not pair[pick]["accepted"] for pair in positives)
+        stats[prefix + "false_accepts"] = false_accepts
+        stats[prefix + "false_rejects"] = false_rejects
+        stats[prefix + "false_accept_rate"] = round(false_accepts / len(negatives), 3) if negatives else None
+    if negatives:
+        stats["false_accept_increase"] = round(stats["false_accept_rate"] - stats["baseline_false_accept_rate"], 3)
+    return stats
+
+
+def breaches(report, tolerances):
+    limits = tolerances.get(report["mode"]) or tolerances.get(report["mode"].split("_")[0], {})
+    return [f"{key} {report[key]} > {limit}" for key, limit in limits.items()
+            if report.get(key) is not None and report[key] > limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--refs", default="References", help="reference recordings directory")
+    parser.add_argument("--store", default=refstore.DEFAULT_PATH, help="reference feature store")
+    parser.add_argument("--corpus", help="user recordings: directory of <word_id>/ folders or a CSV/JSONL manifest")
+    parser.add_argument("--text", action="store_true", help="also compare the Whisper content-check modes")
+    parser.add_argument("--models", nargs="+", default=["base", "tiny"], help="extra Whisper tiers to compare")
+    parser.add_argument("--precisions", nargs="+", default=["fp32", "int8"])
+    parser.add_argument("--tolerances", help="JSON file overriding TOLERANCES per mode")
+    parser.add_argument("--out", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    tolerances = dict(TOLERANCES)
+    if args.tolerances:
+        with open(args.tolerances) as f:
+            tolerances.update(json.load(f))
+
+    store, _ = refstore.open_or_build(args.refs, args.store, analyze_reference, REF_FEATURE_VERSION,
+                                      on_error=lambda name, e: print(f"❌ Failed to load {name}: {e}"),
+                                      inputs=reference_inputs)
+    cache = store.as_cache()
+    items = reference_items(args.refs)
+    if args.corpus:
+        items += [(word_id, path, None, None) for word_id, path in read_jobs(args.corpus)]
+    if not items:
+        print("❌ Nothing to compare")
+        sys.exit(1)
+    negatives = sum(item[3] is False for item in items)
+    print(f"🎙️ {len(items)} checks ({negatives} expected to be rejected)")
+
+    reports = []
+    scores = run_scores(items, cache)
+    for mode in ("multires", "best_match"):
+        reports.append(compare(mode, scores["baseline"], scores[mode], items, "score"))
+    if args.text:
+        texts = run_text(items, args.models, args.precisions)
+        for mode, rows in texts.items():
+            if mode == "baseline":
+                continue
+            # Model modes share the indexed matcher with text_index, so only the model differs
+            against = "baseline" if mode == "text_index" else "text_index"
+            report = compare(mode, texts[against], rows, items, "text")
+            if report is not None:
+                report["against"] = against
+            reports.append(report)
+    reports = [r for r in reports if r is not None]
+
+    failed, untested = False, []
+    print(f"\n{'mode':<22}{'n':>5}{'mean Δ':>8}{'max Δ':>7}{'bias':>7}{'flips':>7}{'base ms':>9}{'mode ms':>9}{'x':>6}")
+    for r in reports:
+        r["breaches"] = breaches(r, tolerances)
+        print(f"{r['mode']:<22}{r['recordings']:>5}{str(r['mean_delta'] if r['mean_delta'] is not None else '-'):>8}"
+              f"{str(r['max_delta'] if r['max_delta'] is not None else '-'):>7}"
+              f"{str(r['bias'] if r['bias'] is not None else '-'):>7}{r['flips']:>7}"
+              f"{r['baseline_ms']:>9}{r['mode_ms']:>9}{str(r['speedup']):>6}")
+        for flip in r["flipped"][:5]:
+            b, m = flip["baseline"], flip["mode"]
+            detail = (f"{b['score']} -> {m['score']}" if r["kind"] == "score"
+                      else f"{b['accepted']} -> {m['accepted']}, heard '{m['heard']}'")
+            print(f"   ↳ {flip['word_id']} ({os.path.basename(flip['file'])}): {detail}")
+        if r["kind"] == "text":
+            against = r["against"]
+            print(f"   false accepts {r['false_accepts']}/{r['negatives']} ({against} {r['baseline_false_accepts']}), "
+                  f"false rejects {r['false_rejects']}/{r['positives']} ({against} {r['baseline_false_rejects']})")
+        if r.get("untested"):
+            print("   ⚠️ untested: every search had a single candidate voice (add a corpus or more voices)")
+            untested.append(r["mode"])
+        elif "searched" in r:
+            print(f"   {r['searched']}/{r['recordings']} searches had more than one candidate")
+        for breach in r["breaches"]:
+            print(f"   ❌ {breach}")
+            failed = True
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"recordings": len(items), "tolerances": tolerances, "modes": reports},
+                      f, indent=4, ensure_ascii=False)
+        print(f"\n📝 Report written to {args.out}")
+
+    if failed:
+        print("\n❌ Parity check failed")
+    elif untested:
+        print(f"\n✅ All tested modes within tolerance (untested: {', '.join(untested)})")
+    else:
+        print("\n✅ All modes within tolerance")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
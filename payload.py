@@ -0,0 +1,163 @@
+"""Content negotiation for /analyze results.
+
+The handler produces one result dict with the graph as raw PNG bytes and,
+when they will be sent, the aligned curves; encode() turns it into the
+format the client asked for in its Accept header:
+
+  application/json      (default) the original body: graph as base64 PNG,
+                        gzip/brotli-compressed when Accept-Encoding allows
+  multipart/mixed       the JSON fields as one part, the raw PNG as another
+  application/msgpack   MessagePack with the PNG as binary, and the curves
+                        (downsampled) as little-endian float16 arrays
+
+The handler adds curves for MessagePack, and for every format when the
+client asked for graph=false; JSON and multipart carry them as plain lists.
+
+MessagePack and brotli are optional dependencies; without them the server
+falls back to JSON and gzip respectively.
+"""
+import base64
+import gzip
+import json
+import uuid
+
+import numpy as np
+from fastapi.responses import Response
+
+# --- CONFIG ---
+# Bodies smaller than this go out uncompressed
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Curves in JSON/multipart are rounded like the float16 MessagePack arrays, to keep the text small
+CURVE_DECIMALS = 3
+
+JSON = "application/json"
+MULTIPART = "multipart/mixed"
+MSGPACK = "application/msgpack"
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK, "*/*": JSON,
+            "application/*": JSON}
+
+
+def _optional(module):
+    try:
+        return __import__(module)
+    except ImportError:
+        return None
+
+
+_msgpack = _optional("msgpack")
+_brotli = _optional("brotli")
+
+
+def _accepted(header):
+    """Values listed in an Accept / Accept-Encoding header, best first (q=0 dropped)."""
+    ranked = []
+    for position, item in enumerate((header or "").split(",")):
+        value, *params = [p.strip() for p in item.split(";")]
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranked.append((-q, position, value.lower()))
+    return [value for _, _, value in sorted(ranked)]
+
+
+def negotiate(accept):
+    """Response media type for an Accept header (JSON when nothing supported is listed)."""
+    for media_type in _accepted(accept):
+        media_type = _ALIASES.get(media_type, media_type)
+        if media_type == MSGPACK and _msgpack is None:
+            continue
+        if media_type in (JSON, MULTIPART, MSGPACK):
+            return media_type
+    return JSON
+
+
+def _compress(body, accept_encoding):
+    """(body, Content-Encoding or None)."""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    encodings = _accepted(accept_encoding)
+    if "br" in encodings and _brotli is not None:
+        return _brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if "gzip" in encodings:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def _curve_lists(curves):
+    return {
+        "ref": np.round(np.asarray(curves["ref"], dtype=float), CURVE_DECIMALS).tolist(),
+        "user": np.round(np.asarray(curves["user"], dtype=float), CURVE_DECIMALS).tolist(),
+        "regions": curves["regions"],
+    }
+
+
+def _json_fields(result):
+    body = {k: v for k, v in result.items() if k != "graph_image"}
+    if body.get("curves") is not None:
+        body["curves"] = _curve_lists(body["curves"])
+    return body
+
+
+def _encode_json(result):
+    # Same fields, in the same order, as before the binary formats existed (plus curves when requested)
+    body = dict(result)
+    if body.get("curves") is not None:
+        body["curves"] = _curve_lists(body["curves"])
+    if body.get("graph_image") is not None:
+        body["graph_image"] = base64.b64encode(body["graph_image"]).decode("utf-8")
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def _encode_multipart(result, boundary):
+    parts = [(JSON, None, json.dumps(_json_fields(result), ensure_ascii=False).encode("utf-8"))]
+    if result.get("graph_image") is not None:
+        parts.append(("image/png", 'attachment; filename="graph.png"', result["graph_image"]))
+    chunks = []
+    for content_type, disposition, data in parts:
+        headers = f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+        if disposition:
+            headers += f"Content-Disposition: {disposition}\r\n"
+        chunks += [headers.encode("ascii"), b"\r\n", data, b"\r\n"]
+    chunks.append(f"--{boundary}--\r\n".encode("ascii"))
+    return b"".join(chunks)
+
+
+def _encode_msgpack(result):
+    body = _json_fields(result)
+    if "graph_image" in result:
+        body["graph_image"] = result["graph_image"]
+    curves = result.get("curves")
+    if curves is not None:
+        body["curves"] = {
+            "ref": np.asarray(curves["ref"], dtype="<f2").tobytes(),
+            "user": np.asarray(curves["user"], dtype="<f2").tobytes(),
+            "regions": curves["regions"],
+        }
+    return _msgpack.packb(body, use_bin_type=True)
+
+
+def encode(result, accept=None, accept_encoding=None, status_code=200):
+    """Response for an /analyze result dict (graph_image as PNG bytes, optional curves)."""
+    media_type = negotiate(accept)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if media_type == MSGPACK:
+        body = _encode_msgpack(result)
+    elif media_type == MULTIPART:
+        boundary = uuid.uuid4().hex
+        body = _encode_multipart(result, boundary)
+        media_type = f"{MULTIPART}; boundary={boundary}"
+    else:
+        # PNG and msgpack payloads are already compact; only the text format is compressed
+        body, content_encoding = _compress(_encode_json(result), accept_encoding)
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
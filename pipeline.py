@@ -0,0 +1,196 @@
+import io
+import os
+
+import numpy as np
+
+import alignment
+import metrics
+from catalog import CATALOG
+from text_match import TEXT_INDEX
+import ref_index
+
+# librosa (numba), fastdtw, matplotlib and scipy.signal are imported inside the
+# stages that use them so importing the server stays fast (see importtime_test.py).
+
+# Bump whenever analyze_reference() output changes so stored features get rebuilt
+REF_FEATURE_VERSION = 4
+# pyin hop; syllable cues are computed on the same frame grid as the contour
+PYIN_HOP = 512
+# Aligned curves are thinned to this many points in multi-resolution mode
+MAX_PLOT_POINTS = 400
+
+# --- HELPERS ---
+def check_for_silence(file_path):
+    """Returns True if the audio is basically silent."""
+    import librosa
+    try:
+        y, sr = librosa.load(file_path, sr=16000, mono=True)
+        rms = librosa.feature.rms(y=y)
+        if rms.mean() < 0.005:
+            return True
+        return False
+    except Exception as e:
+        metrics.record_error("check_for_silence", e)
+        return True
+
+
+def get_audio_duration(file_path):
+    import librosa
+    try:
+        return round(librosa.get_duration(path=file_path), 3)
+    except Exception as e:
+        metrics.record_error("get_audio_duration", e)
+        return None
+
+
+def process_audio_file(file_path):
+    return _extract_pitch(file_path)[0]
+
+
+def _extract_pitch(file_path):
+    """(norm_pitch, trimmed audio, sr, raw f0); audio and f0 are None if loading failed."""
+    import librosa
+    from scipy.signal import savgol_filter
+    try:
+        y, sr = librosa.load(file_path, sr=22050, mono=True)
+        y_trimmed, _ = librosa.effects.trim(y, top_db=25)
+        f0, _, _ = librosa.pyin(y_trimmed, fmin=50, fmax=400, sr=sr, hop_length=PYIN_HOP)
+        f0 = np.nan_to_num(f0)
+        valid_pitch = f0[f0 > 0]
+        if len(valid_pitch) == 0: return np.zeros(100), y_trimmed, sr, f0
+        mean = np.mean(valid_pitch)
+        std = np.std(valid_pitch)
+        norm_pitch = (f0 - mean) / (std + 1e-6)
+        norm_pitch[f0 < 1] = 0
+        try:
+            norm_pitch = savgol_filter(norm_pitch, 21, 2)
+        except Exception as e:
+            # Contour shorter than the filter window; keep it unsmoothed
+            metrics.record_error("savgol_filter", e)
+        return norm_pitch, y_trimmed, sr, f0
+    except Exception as e:
+        metrics.record_error("process_audio_file", e)
+        return np.zeros(100), None, None, None
+
+
+def segment_syllables(y, sr, f0, n_frames, n_labels):
+    """Syllable boundaries in contour frames (n_labels + 1 values, 0 to n_frames - 1).
+
+    Each inner boundary snaps to the nearest acoustic cue (onset, energy dip
+    or start of voicing) within half a syllable of its equal-width position,
+    and stays at that position when there is none.
+    """
+    equal = np.linspace(0, n_frames - 1, n_labels + 1)
+    if y is None or f0 is None or n_labels < 2 or len(f0) != n_frames:
+        return np.round(equal).astype(np.int32)
+
+    import librosa
+    from scipy.signal import argrelmin
+    onsets = librosa.onset.onset_detect(y=y, sr=sr, hop_length=PYIN_HOP, backtrack=True, units="frames")
+    rms = librosa.feature.rms(y=y, hop_length=PYIN_HOP)[0]
+    dips = argrelmin(rms)[0]
+    voiced = f0 > 0
+    voicing_starts = np.flatnonzero(voiced[1:] & ~voiced[:-1]) + 1
+    cues = np.unique(np.concatenate([onsets, dips, voicing_starts]))
+    cues = cues[(cues > 0) & (cues < n_frames - 1)]
+
+    half_slot = (n_frames - 1) / n_labels / 2
+    bounds = [0]
+    for target in equal[1:-1]:
+        near = cues[(cues >= bounds[-1]) & (np.abs(cues - target) <= half_slot)]
+        if near.size:
+            bounds.append(int(near[np.argmin(np.abs(near - target))]))
+        else:
+            bounds.append(max(bounds[-1], int(round(target))))
+    bounds.append(n_frames - 1)
+    return np.asarray(bounds, dtype=np.int32)
+
+
+def reference_inputs(word_id):
+    """Catalog data analyze_reference depends on; stored with each reference so an edit rebuilds it."""
+    return {"syllables": CATALOG.syllables(word_id) or []}
+
+
+def analyze_reference(file_path):
+    """Features precomputed once per reference and stored in the reference store."""
+    with metrics.span("reference_load"):
+        norm_pitch, y, sr, f0 = _extract_pitch(file_path)
+        word_id = os.path.splitext(os.path.basename(file_path))[0]
+        labels = CATALOG.syllables(word_id) or []
+        bounds = segment_syllables(y, sr, f0, len(norm_pitch), len(labels)) if labels else np.zeros(0, np.int32)
+        return {"norm_pitch": norm_pitch, "syllable_bounds": bounds,
+                **ref_index.index_features(norm_pitch), **alignment.pyramid_features(norm_pitch)}
+
+
+def score_alignment(ref_norm, user_norm, ref_levels=None):
+    """DTW-aligns two contours; returns (raw score 0-100, path).
+
+    With ref_levels (the reference pyramid) the coarse-to-fine aligner is
+    used instead of fastdtw: near-linear in length, and within 1 point of
+    the fastdtw score on the bundled references.
+    """
+    with metrics.span("dtw"):
+        if ref_levels is not None:
+            dist, path = alignment.coarse_to_fine(ref_levels, user_norm)
+        else:
+            from fastdtw import fastdtw
+            dist, path = fastdtw(ref_norm, user_norm, dist=lambda x, y: abs(x - y))
+    return max(0, 100 - (dist / len(path) * 25)), path
+
+
+def match_expected_text(text, word_id):
+    text = text.lower().strip()
+
+    # --- MANUAL REPETITION CLEANER ---
+    #please just stop looping
+    if len(text) > 50:
+        text = text[:20]
+        print(f"⚠️ Truncated repetition loop: {text}...")
+
+    # Canonical kana/romaji comparison against the indexed catalog phrases. It gets the
+    # punctuation too, which separates words for the short forms ("ええ、はい")
+    matched = TEXT_INDEX.matches(text, word_id)
+
+    text = text.replace("。", "").replace("、", "").replace("!", "").replace("?", "")
+    if matched is None: return True, text
+    return matched, text
+
+
+def get_syllable_regions(path, word_id, bounds=None):
+    labels = CATALOG.syllables(word_id)
+    if not labels: return []
+    if len(path) == 0: return []
+    if bounds is not None and len(bounds) == len(labels) + 1:
+        # Boundaries segmented once at reference load
+        targets = np.asarray(bounds[1:])
+    else:
+        # Equal-width split of the reference timeline
+        chunk_size = path[-1][0] / len(labels)
+        targets = np.array([int((i + 1) * chunk_size) for i in range(len(labels))])
+    # Path reference indices never decrease, so each boundary is one binary search
+    ref_idx = np.fromiter((i for i, _ in path), dtype=np.int64, count=len(path))
+    ends = np.minimum(np.searchsorted(ref_idx, targets, side="left"), len(path) - 1)
+    starts = np.concatenate(([0], ends[:-1]))
+    return [{"label": label, "start_index": int(start), "end_index": int(end)}
+            for label, start, end in zip(labels, starts, ends)]
+
+
+def render_graph(ref, user, regions, word_id):
+    """The feedback graph as PNG bytes."""
+    from matplotlib.figure import Figure
+
+    # Figure API rather than pyplot: pyplot keeps global state and graphs are drawn from worker threads
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    colors = ['#e6f2ff', '#fff0e6', '#e6ffe6']
+    for i, r in enumerate(regions):
+        ax.axvspan(r['start_index'], r['end_index'], color=colors[i % 3], alpha=0.5)
+        ax.text((r['start_index'] + r['end_index']) / 2, 2.2, r['label'], ha='center', weight='bold')
+    ax.plot(ref, 'g', linewidth=3, label='Teacher')
+    ax.plot(user, 'r--', linewidth=3, label='You')
+    ax.set_ylim(-3, 3)
+    ax.legend()
+    ax.set_title(f"Pronunciation: {word_id}")
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    return buf.getvalue()
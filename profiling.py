@@ -0,0 +1,117 @@
+import cProfile
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- CONFIG ---
+PROFILE_DIR = os.environ.get("SEIKAKU_PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("SEIKAKU_PROFILE_KEEP", "20"))
+
+# sample_rate: fraction of /analyze calls to profile (0 = off)
+# force_next: profile the next N calls regardless of the rate
+settings = {
+    "sample_rate": float(os.environ.get("SEIKAKU_PROFILE_RATE", "0")),
+    "force_next": 0,
+}
+
+# cProfile hooks the whole interpreter, so only one request is profiled at a time
+_active = threading.Lock()
+# Guards settings: requests read and decrement force_next from worker threads
+_settings_lock = threading.Lock()
+
+
+def configure(sample_rate=None, force_next=None):
+    with _settings_lock:
+        if sample_rate is not None:
+            settings["sample_rate"] = min(1.0, max(0.0, float(sample_rate)))
+        if force_next is not None:
+            settings["force_next"] = max(0, int(force_next))
+        return dict(settings)
+
+
+def _should_profile():
+    # Only called while holding _active, so a forced profile is never used up by a request that can't be profiled
+    with _settings_lock:
+        if settings["force_next"] > 0:
+            settings["force_next"] -= 1
+            return True
+        return settings["sample_rate"] > 0 and random.random() < settings["sample_rate"]
+
+
+@contextmanager
+def profile_request(meta):
+    """Profiles the block if this request is sampled.
+
+    Yields the meta dict (fill in extra fields such as audio_seconds) or None
+    when the request is not being profiled.
+    """
+    if not _active.acquire(blocking=False):
+        yield None
+        return
+    if not _should_profile():
+        _active.release()
+        yield None
+        return
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield meta
+    finally:
+        profiler.disable()
+        _active.release()
+        meta["wall_seconds"] = round(time.perf_counter() - start, 4)
+        try:
+            _save(profiler, meta)
+        except OSError as e:
+            print(f"❌ Could not save profile: {e}")
+
+
+def _save(profiler, meta):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", str(meta.get("word_id", "unknown")))[:64]
+    name = f"{stamp}_{safe_id}"
+
+    profiler.dump_stats(os.path.join(PROFILE_DIR, name + ".pstats"))
+    meta = dict(meta, name=name, created=datetime.now().isoformat(timespec="seconds"))
+    with open(os.path.join(PROFILE_DIR, name + ".json"), "w") as f:
+        json.dump(meta, f, indent=4)
+    print(f"🔬 Saved profile: {name} ({meta['wall_seconds']}s)")
+
+    # Keep only the newest PROFILE_KEEP profiles
+    for old in list_profiles()[PROFILE_KEEP:]:
+        for ext in (".pstats", ".json"):
+            path = os.path.join(PROFILE_DIR, old["name"] + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles():
+    """Saved profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, filename), "r") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_path(name):
+    """Path of a saved .pstats file, or None if `name` is not a known profile."""
+    known = {p["name"] for p in list_profiles()}
+    if name not in known:
+        return None
+    return os.path.join(PROFILE_DIR, name + ".pstats")
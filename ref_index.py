@@ -0,0 +1,79 @@
+import math
+import re
+
+import numpy as np
+
+import alignment
+from catalog import CATALOG
+
+VOICE_SUFFIX = re.compile(r"(Male|Female)$")
+
+
+def phrase_of(word_id):
+    """Catalog phrase of a reference; falls back to 'HelloMale' -> 'Hello' for uncatalogued files."""
+    return CATALOG.phrase_id(word_id) or VOICE_SUFFIX.sub("", word_id) or word_id
+
+
+class ReferenceIndex:
+    """All native-speaker references per phrase, with precomputed LB envelopes.
+
+    search() finds the reference closest to a student contour: candidates
+    are visited in LB_Kim order and skipped when LB_Kim or LB_Keogh already
+    exceeds the best exact (banded) DTW distance found so far, so most of
+    them never reach the DTW step.
+    """
+
+    def __init__(self, radius=alignment.BAND_RADIUS):
+        self.radius = radius
+        self._phrases = {}
+
+    @classmethod
+    def from_cache(cls, ref_cache):
+        index = cls()
+        for word_id, entry in ref_cache.items():
+            index.add(word_id, entry)
+        return index
+
+    def add(self, word_id, entry):
+        # Stored features (see analyze_reference) or computed on the fly for ad-hoc contours
+        contour = entry.get("index_contour")
+        if contour is None:
+            contour = alignment.resample(entry["norm_pitch"])
+            upper, lower = alignment.envelope(contour, self.radius)
+        else:
+            upper, lower = entry["index_upper"], entry["index_lower"]
+        self._phrases.setdefault(phrase_of(word_id), []).append((word_id, contour, upper, lower))
+
+    def candidates(self, word_id):
+        return [c[0] for c in self._phrases.get(phrase_of(word_id), [])]
+
+    def search(self, user_norm, word_id):
+        """Returns (best word_id, banded DTW distance, stats) among word_id's phrase."""
+        refs = self._phrases.get(phrase_of(word_id), [])
+        if not refs:
+            return word_id, math.inf, {"candidates": 0, "pruned": 0}
+
+        q = alignment.resample(user_norm, len(refs[0][1]))
+        # Visit the requested reference first (a good initial bound), then by LB_Kim
+        ordered = sorted(refs, key=lambda r: (r[0] != word_id, alignment.lb_kim(q, r[1])))
+
+        best_id, best_dist = word_id, math.inf
+        pruned = 0
+        for ref_id, contour, upper, lower in ordered:
+            if alignment.lb_kim(q, contour) >= best_dist:
+                pruned += 1
+                continue
+            if alignment.lb_keogh(q, upper, lower) >= best_dist:
+                pruned += 1
+                continue
+            dist = alignment.banded_dtw(q, contour, self.radius, best_dist)
+            if dist < best_dist:
+                best_id, best_dist = ref_id, dist
+        return best_id, best_dist, {"candidates": len(refs), "pruned": pruned}
+
+
+def index_features(norm_pitch, radius=alignment.BAND_RADIUS):
+    """Per-reference arrays stored alongside the contour for the index."""
+    contour = alignment.resample(norm_pitch)
+    upper, lower = alignment.envelope(contour, radius)
+    return {"index_contour": contour, "index_upper": np.asarray(upper), "index_lower": np.asarray(lower)}
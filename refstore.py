@@ -0,0 +1,219 @@
+"""Versioned, memory-mapped store of reference features.
+
+All reference contours (and anything derived from them) are packed into a
+single file that every worker maps read-only, so the pages are shared
+between processes and a new worker starts without re-running pyin.
+
+Layout:
+    MAGIC (8 bytes) | header length, data start (uint32, uint64 LE)
+    | JSON header | pad | arrays
+Each array starts on a 64-byte boundary. The header records, per word_id,
+the name/dtype/shape/offset (from data start) of every array plus the size
+and mtime of the source audio and any other inputs the features depend on
+(the catalog's syllable labels), so a changed reference, an edited phrase
+or a new feature version triggers a rebuild. References whose extraction failed are listed
+under "failed" with the same source stat, so they are not retried (and the
+store rebuilt) on every start until the file itself changes.
+
+    python refstore.py References          # prebuild offline
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialised across processes
+    fcntl = None
+
+MAGIC = b"SKREF\x00\x01\x00"
+PREAMBLE = struct.Struct("<IQ")
+FORMAT_VERSION = 1
+ALIGN = 64
+AUDIO_EXTENSIONS = (".wav", ".mp3")
+DEFAULT_PATH = os.environ.get("SEIKAKU_REF_STORE", "reference_features.bin")
+
+
+class ReferenceStore:
+    """Read-only view over a store file; arrays are zero-copy mmap slices."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = len(MAGIC) + PREAMBLE.size
+        if len(self._mm) < start or self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a reference store")
+        header_len, self._data_start = PREAMBLE.unpack_from(self._mm, len(MAGIC))
+        if start + header_len > len(self._mm):
+            raise ValueError(f"{path} is truncated")
+        self.header = json.loads(self._mm[start:start + header_len].decode("utf-8"))
+        self._entries = {}
+        # An interrupted copy can cut the arrays off too; get() would only fail on first use
+        for meta in self.header["entries"].values():
+            for spec in meta["arrays"].values():
+                nbytes = np.dtype(spec["dtype"]).itemsize * int(np.prod(spec["shape"]))
+                end = self._data_start + spec["offset"] + nbytes
+                if end > len(self._mm):
+                    raise ValueError(f"{path} is truncated")
+
+    @property
+    def feature_version(self):
+        return self.header["feature_version"]
+
+    def word_ids(self):
+        return list(self.header["entries"])
+
+    def get(self, word_id):
+        """{name: ndarray} for one reference, or None if it is not stored."""
+        if word_id in self._entries:
+            return self._entries[word_id]
+        meta = self.header["entries"].get(word_id)
+        if meta is None:
+            return None
+        entry = {}
+        for name, spec in meta["arrays"].items():
+            count = int(np.prod(spec["shape"])) if spec["shape"] else 1
+            if count == 0:
+                entry[name] = np.zeros(spec["shape"], dtype=spec["dtype"])
+                continue
+            arr = np.frombuffer(self._mm, dtype=spec["dtype"], count=count,
+                                offset=self._data_start + spec["offset"])
+            entry[name] = arr.reshape(spec["shape"])
+        self._entries[word_id] = entry
+        return entry
+
+    def release(self):
+        """Lets the kernel drop the mapped pages; they fault back in from the file on next access."""
+        if hasattr(mmap, "MADV_DONTNEED"):
+            self._mm.madvise(mmap.MADV_DONTNEED)
+
+    def as_cache(self):
+        return {word_id: self.get(word_id) for word_id in self.word_ids()}
+
+
+def list_sources(ref_dir, inputs=None):
+    """{word_id: source record}; inputs(word_id) -> dict of non-audio inputs, stored with each record."""
+    sources = {}
+    if not os.path.isdir(ref_dir):
+        return sources
+    for filename in sorted(os.listdir(ref_dir)):
+        if filename.endswith(AUDIO_EXTENSIONS):
+            path = os.path.join(ref_dir, filename)
+            stat = os.stat(path)
+            word_id = os.path.splitext(filename)[0]
+            sources[word_id] = {"file": filename, "size": stat.st_size, "mtime": int(stat.st_mtime)}
+            if inputs is not None:
+                sources[word_id]["inputs"] = inputs(word_id)
+    return sources
+
+
+def is_current(store, ref_dir, feature_version, inputs=None):
+    if store.header.get("format_version") != FORMAT_VERSION:
+        return False
+    if store.feature_version != feature_version:
+        return False
+    stored = {w: e["source"] for w, e in store.header["entries"].items()}
+    stored.update({w: f["source"] for w, f in store.header.get("failed", {}).items()})
+    # Round-trip through JSON so tuples in inputs compare equal to the stored lists
+    return stored == json.loads(json.dumps(list_sources(ref_dir, inputs)))
+
+
+def build(ref_dir, out_path, featurize, feature_version, on_error=None, inputs=None):
+    """Runs featurize(path) -> {name: ndarray} on every reference and writes the store."""
+    entries, failed, blobs = {}, {}, []
+    offset = 0
+    for word_id, source in list_sources(ref_dir, inputs).items():
+        try:
+            features = featurize(os.path.join(ref_dir, source["file"]))
+        except Exception as e:
+            if on_error:
+                on_error(source["file"], e)
+            failed[word_id] = {"source": source, "error": f"{type(e).__name__}: {e}"}
+            continue
+        arrays = {}
+        for name, arr in features.items():
+            arr = np.ascontiguousarray(arr)
+            offset += -offset % ALIGN
+            arrays[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            blobs.append((offset, arr.tobytes()))
+            offset += arr.nbytes
+        entries[word_id] = {"source": source, "arrays": arrays}
+
+    header = {"format_version": FORMAT_VERSION, "feature_version": feature_version, "entries": entries,
+              "failed": failed}
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = len(MAGIC) + PREAMBLE.size + len(header_bytes)
+    data_start += -data_start % ALIGN
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(PREAMBLE.pack(len(header_bytes), data_start))
+        f.write(header_bytes)
+        for rel_offset, blob in blobs:
+            f.seek(data_start + rel_offset)
+            f.write(blob)
+    # Atomic swap: workers that already mapped the old file keep a valid view
+    os.replace(tmp_path, out_path)
+
+
+def open_or_build(ref_dir, store_path, featurize, feature_version, on_error=None, inputs=None):
+    """Maps the store, rebuilding it first if it is missing or stale.
+
+    inputs(word_id), if given, returns the non-audio data featurize depends
+    on; a change in it makes the store stale like a changed audio file.
+
+    Concurrent workers serialise on a lock file so only one of them runs the
+    feature extraction; the others wait and map the result.
+    """
+    store = _try_open(store_path)
+    if store is not None and is_current(store, ref_dir, feature_version, inputs):
+        _report_failed(store, on_error)
+        return store, False
+
+    with open(store_path + ".lock", "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            store = _try_open(store_path)
+            if store is not None and is_current(store, ref_dir, feature_version, inputs):
+                _report_failed(store, on_error)
+                return store, False
+            build(ref_dir, store_path, featurize, feature_version, on_error, inputs)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    return ReferenceStore(store_path), True
+
+
+def _report_failed(store, on_error):
+    # Failures recorded by the build that produced this store, so they still show up on every start
+    if on_error:
+        for failure in store.header.get("failed", {}).values():
+            on_error(failure["source"]["file"], RuntimeError(failure["error"]))
+
+
+def _try_open(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        return ReferenceStore(path)
+    except (OSError, ValueError, KeyError, struct.error):
+        # Missing, truncated or not a store: treated as absent and rebuilt
+        return None
+
+
+if __name__ == "__main__":
+    from pipeline import REF_FEATURE_VERSION, analyze_reference, reference_inputs
+
+    ref_dir = sys.argv[1] if len(sys.argv) > 1 else "References"
+    out_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+    build(ref_dir, out_path, analyze_reference, REF_FEATURE_VERSION,
+          on_error=lambda name, e: print(f"❌ Failed to load {name}: {e}"), inputs=reference_inputs)
+    store = ReferenceStore(out_path)
+    print(f"✅ Packed {len(store.word_ids())} references into {out_path}")
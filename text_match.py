@@ -0,0 +1,223 @@
+"""Indexed matching of Whisper transcripts against the catalog's expected text.
+
+Both sides are reduced to one canonical form before comparing:
+  - NFKC (full-width latin/digits, half-width kana), lowercase
+  - katakana -> hiragana -> Hepburn romaji (small tsu, youon, long-vowel mark)
+  - long vowels collapsed (aa/ii/uu/ee/oo/ou/ei -> single vowel)
+  - whitespace and punctuation dropped
+so "コンニチワ", "こんにちわ", "Konnichiwa" and "konnichiwa" are the same
+string. Kanji have no reading here and are kept as-is; the catalog lists
+kanji spellings explicitly.
+
+Every accepted phrase is indexed once as a set of padded character
+bigrams (plus an inverted bigram index for open-vocabulary lookup). A check
+is then a substring test and one small set intersection per accepted
+phrase, independent of curriculum size.
+
+Short romaji forms ("hai", "hi", "yes") are too short to score: they occur
+inside unrelated words ("watashi", "hashi") and share most of their bigrams
+with them. They are only accepted as a whole word of the transcript, where
+words are split on Whisper's punctuation and spaces ("ええ、はい" -> "e", "hai").
+"""
+import re
+import threading
+import unicodedata
+
+from catalog import CATALOG
+
+# --- CONFIG ---
+# Bigram Dice above which a transcript is accepted. Tuned on perturbed
+# catalog phrases (dropped/substituted kana, katakana, fillers, repeats) as
+# positives and, as negatives, every other catalog phrase plus ~80 common
+# words and near-homophones: accepts 98% / 1% of them, where the previous
+# SequenceMatcher ratio > 0.6 rule accepted 97% / 4%.
+ACCEPT_SIMILARITY = 0.65
+# Romaji forms shorter than this must be a whole word of the transcript
+MIN_CONTAINED_LENGTH = 4
+_WORD_SPLIT = re.compile(r"[\W_]+")
+
+# --- KANA -> ROMAJI ---
+_BASE = {
+    "あ": "a", "い": "i", "う": "u", "え": "e", "お": "o",
+    "か": "ka", "き": "ki", "く": "ku", "け": "ke", "こ": "ko",
+    "さ": "sa", "し": "shi", "す": "su", "せ": "se", "そ": "so",
+    "た": "ta", "ち": "chi", "つ": "tsu", "て": "te", "と": "to",
+    "な": "na", "に": "ni", "ぬ": "nu", "ね": "ne", "の": "no",
+    "は": "ha", "ひ": "hi", "ふ": "fu", "へ": "he", "ほ": "ho",
+    "ま": "ma", "み": "mi", "む": "mu", "め": "me", "も": "mo",
+    "や": "ya", "ゆ": "yu", "よ": "yo",
+    "ら": "ra", "り": "ri", "る": "ru", "れ": "re", "ろ": "ro",
+    "わ": "wa", "ゐ": "i", "ゑ": "e", "を": "o", "ん": "n",
+    "が": "ga", "ぎ": "gi", "ぐ": "gu", "げ": "ge", "ご": "go",
+    "ざ": "za", "じ": "ji", "ず": "zu", "ぜ": "ze", "ぞ": "zo",
+    "だ": "da", "ぢ": "ji", "づ": "zu", "で": "de", "ど": "do",
+    "ば": "ba", "び": "bi", "ぶ": "bu", "べ": "be", "ぼ": "bo",
+    "ぱ": "pa", "ぴ": "pi", "ぷ": "pu", "ぺ": "pe", "ぽ": "po",
+    "ゔ": "vu",
+    "ぁ": "a", "ぃ": "i", "ぅ": "u", "ぇ": "e", "ぉ": "o",
+    "ゃ": "ya", "ゅ": "yu", "ょ": "yo", "ゎ": "wa",
+}
+_SMALL_Y = {"ゃ": "a", "ゅ": "u", "ょ": "o"}
+_LONG_VOWELS = re.compile(r"aa|ii|uu|ee|oo|ou|ei")
+
+
+def _katakana_to_hiragana(text):
+    return "".join(chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch for ch in text)
+
+
+def kana_to_romaji(text):
+    out = []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        nxt = text[i + 1] if i + 1 < len(text) else ""
+        if ch == "っ":
+            # Geminate: double the next consonant
+            following = _BASE.get(nxt, "")
+            if following:
+                out.append(following[0])
+            i += 1
+            continue
+        if ch == "ー":
+            # Long-vowel mark repeats the previous vowel (collapsed later)
+            if out and out[-1]:
+                out.append(out[-1][-1])
+            i += 1
+            continue
+        roma = _BASE.get(ch)
+        if roma is None:
+            out.append(ch)
+        elif nxt in _SMALL_Y and roma.endswith("i") and len(roma) > 1:
+            # Youon: きゃ -> kya, しゃ -> sha, ちょ -> cho, じゅ -> ju
+            stem = roma[:-1]
+            out.append(stem + ("" if stem in ("sh", "ch", "j") else "y") + _SMALL_Y[nxt])
+            i += 1
+        else:
+            out.append(roma)
+        i += 1
+    return "".join(out)
+
+
+def canonicalize(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = kana_to_romaji(_katakana_to_hiragana(text))
+    text = "".join(ch for ch in text if ch.isalnum())
+    return _LONG_VOWELS.sub(lambda m: m.group(0)[0], text)
+
+
+def variants(phrase):
+    """Canonical forms of an expected phrase. A non-initial は is also read as the particle 'wa'."""
+    forms = {canonicalize(phrase)}
+    hira = _katakana_to_hiragana(unicodedata.normalize("NFKC", phrase))
+    if "は" in hira[1:]:
+        forms.add(canonicalize(hira[0] + hira[1:].replace("は", "わ")))
+    forms.discard("")
+    return forms
+
+
+def bigrams(canonical):
+    padded = f"^{canonical}$"
+    return frozenset(padded[i:i + 2] for i in range(len(padded) - 1))
+
+
+def dice(a, b):
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def words(text):
+    """Canonical forms of the transcript's words (split on punctuation and spaces)."""
+    return {canonicalize(w) for w in _WORD_SPLIT.split(unicodedata.normalize("NFKC", text)) if w}
+
+
+def is_short(form):
+    # Kanji spellings (私, 先生) are whole words by themselves and stay substring-matched
+    return form.isascii() and len(form) < MIN_CONTAINED_LENGTH
+
+
+class PhraseIndex:
+    """Canonical forms + bigram sets of every expected phrase in the catalog."""
+
+    def __init__(self, catalog=CATALOG):
+        self.catalog = catalog
+        self._by_word = None
+        self._postings = {}
+        self._forms = []
+        self._lock = threading.Lock()
+
+    def _build(self):
+        with self._lock:
+            if self._by_word is not None:
+                return
+            by_word, postings, forms, form_ids = {}, {}, [], {}
+            for word_id in self.catalog.reference_ids():
+                entries = []
+                for phrase in self.catalog.expected_text(word_id) or []:
+                    for form in variants(phrase):
+                        grams = bigrams(form)
+                        entries.append((form, grams, phrase))
+                        if form not in form_ids:
+                            form_ids[form] = len(forms)
+                            forms.append((form, grams, set()))
+                            for g in grams:
+                                postings.setdefault(g, set()).add(form_ids[form])
+                        forms[form_ids[form]][2].add(word_id)
+                by_word[word_id] = entries
+            self._postings, self._forms = postings, forms
+            self._by_word = by_word
+
+    def reload(self):
+        with self._lock:
+            self._by_word = None
+
+    def score(self, text, word_id):
+        """(similarity 0-1, matched phrase) of text against word_id's phrases, or None if uncatalogued."""
+        if self._by_word is None:
+            self._build()
+        entries = self._by_word.get(word_id)
+        if entries is None:
+            return None
+        canonical = canonicalize(text)
+        grams = bigrams(canonical)
+        text_words = None
+        best, best_phrase = 0.0, None
+        for form, form_grams, phrase in entries:
+            if is_short(form):
+                if text_words is None:
+                    text_words = words(text)
+                # "はいはい" is still a yes
+                if any(w == form * (len(w) // len(form)) for w in text_words):
+                    return 1.0, phrase
+                continue
+            if form in canonical:
+                return 1.0, phrase
+            sim = dice(grams, form_grams)
+            if sim > best:
+                best, best_phrase = sim, phrase
+        return best, best_phrase
+
+    def matches(self, text, word_id):
+        """True/False, or None when word_id has no expected text."""
+        result = self.score(text, word_id)
+        if result is None:
+            return None
+        return result[0] > ACCEPT_SIMILARITY
+
+    def search(self, text, limit=5):
+        """Open-vocabulary lookup: [(similarity, canonical form, word_ids)] best first."""
+        if self._by_word is None:
+            self._build()
+        grams = bigrams(canonicalize(text))
+        candidates = set()
+        for g in grams:
+            candidates |= self._postings.get(g, set())
+        scored = []
+        for i in candidates:
+            form, form_grams, word_ids = self._forms[i]
+            scored.append((dice(grams, form_grams), form, sorted(word_ids)))
+        scored.sort(key=lambda r: -r[0])
+        return scored[:limit]
+
+
+TEXT_INDEX = PhraseIndex()
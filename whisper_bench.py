@@ -0,0 +1,109 @@
+"""Accept/reject agreement of Whisper tiers against the catalog's expected text.
+
+Transcribes every bundled reference with each model tier/precision and
+compares the content-check verdict with the baseline (small, fp32).
+
+    python whisper_bench.py --refs References --out whisper_bench.json
+"""
+import argparse
+import json
+import os
+import time
+
+import asr
+from catalog import CATALOG
+from pipeline import match_expected_text
+
+
+def current_rss_mb():
+    # Linux only; returns None elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1e6, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def reference_files(ref_dir):
+    files = []
+    for filename in sorted(os.listdir(ref_dir)):
+        word_id = os.path.splitext(filename)[0]
+        if filename.endswith((".wav", ".mp3")) and CATALOG.expected_text(word_id) is not None:
+            files.append((word_id, os.path.join(ref_dir, filename)))
+    return files
+
+
+def run_config(name, precision, files):
+    # torch/whisper are imported and the previous config's memory handed back
+    # before the first reading, so the delta is this model's load only
+    import whisper  # noqa: F401
+    asr.release_memory()
+    rss_before = current_rss_mb()
+    load_start = time.perf_counter()
+    model = asr.load_model(name, precision)
+    load_seconds = time.perf_counter() - load_start
+    rss_after = current_rss_mb()
+
+    verdicts = {}
+    latencies = []
+    for word_id, path in files:
+        start = time.perf_counter()
+        accepted, heard = match_expected_text(asr.transcribe(model, path), word_id)
+        latencies.append(time.perf_counter() - start)
+        verdicts[word_id] = {"accepted": accepted, "heard": heard}
+    del model
+    asr.release_memory()
+
+    return {
+        "model": name,
+        "precision": precision,
+        "load_seconds": round(load_seconds, 2),
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before and rss_after else None,
+        "mean_latency_seconds": round(sum(latencies) / len(latencies), 3) if latencies else None,
+        "accept_rate": round(sum(v["accepted"] for v in verdicts.values()) / len(verdicts), 3) if verdicts else None,
+        "verdicts": verdicts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--refs", default="References", help="directory of reference recordings")
+    parser.add_argument("--models", nargs="+", default=list(asr.MODEL_TIERS), choices=asr.MODEL_TIERS)
+    parser.add_argument("--precisions", nargs="+", default=list(asr.PRECISIONS), choices=asr.PRECISIONS)
+    parser.add_argument("--out", help="write the full report as JSON")
+    args = parser.parse_args()
+
+    files = reference_files(args.refs)
+    if not files:
+        print(f"❌ No references with expected text found in '{args.refs}'")
+        return
+
+    # Baseline first so every other config is compared against it
+    configs = [("small", "fp32")]
+    configs += [(m, p) for m in args.models for p in args.precisions if (m, p) != ("small", "fp32")]
+
+    results = []
+    for name, precision in configs:
+        print(f"🎧 {name} / {precision} ...")
+        results.append(run_config(name, precision, files))
+
+    baseline = results[0]["verdicts"]
+    print(f"\n{'model':<8}{'prec':<6}{'load s':>8}{'RSS MB':>9}{'lat s':>8}{'accept':>8}{'agree':>8}")
+    for r in results:
+        agree = sum(r["verdicts"][w]["accepted"] == baseline[w]["accepted"] for w in baseline)
+        r["agreement"] = round(agree / len(baseline), 3)
+        r["disagreements"] = [w for w in baseline if r["verdicts"][w]["accepted"] != baseline[w]["accepted"]]
+        print(f"{r['model']:<8}{r['precision']:<6}{r['load_seconds']:>8}{str(r['rss_delta_mb']):>9}"
+              f"{r['mean_latency_seconds']:>8}{r['accept_rate']:>8}{r['agreement']:>8}")
+        for word_id in r["disagreements"]:
+            print(f"   ↳ {word_id}: heard '{r['verdicts'][word_id]['heard']}'")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        print(f"\n📝 Report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
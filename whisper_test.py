@@ -2,48 +2,7 @@ import whisper
 from difflib import SequenceMatcher
 import os
 
-EXPECTED_TEXT_MAP = {
-    "HelloMale": ["konnichiwa", "hello", "こんにちは", "こんにちわ"],
-    "HelloFemale": ["konnichiwa", "hello", "こんにちは", "こんにちわ"],
-
-    "YesMale": ["hai", "hi", "yes", "はい"],
-    "YesFemale": ["hai", "hi", "yes", "はい"],
-
-    "IMale": ["watashi", "watashiwa", "私", "わたし"],
-    "IFemale": ["watashi", "watashiwa", "私", "わたし"],
-
-    "BeMale": ["desu", "dess", "です"],
-    "BeFemale": ["desu", "dess", "です"],
-
-    "TeacherMale": ["sensei", "sensay", "先生", "せんせい"],
-    "TeacherFemale": ["sensei", "sensay", "先生", "せんせい"],
-
-    "YesIAmATeacherMale": [
-        "hai watashi wa sensei desu",
-        "i am a teacher",
-        "はい私は先生です",
-        "はいわたしはせんせいです",
-        "はい、私は先生です"
-    ],
-    "YesIAmATeacherFemale": [
-        "hai watashi wa sensei desu",
-        "はい私は先生です",
-        "はいわたしはせんせいです",
-        "はい、私は先生です"
-    ],
-
-    "IAmAStudentMale": [
-        "watashi wa gakusei desu",
-        "i am a student",
-        "私は学生です",
-        "わたしはがくせいです"
-    ],
-    "IAmAStudentFemale": [
-        "watashi wa gakusei desu",
-        "私は学生です",
-        "わたしはがくせいです"
-    ]
-}
+from catalog import CATALOG
 
 
 def validate_speech_content(audio_path, word_id):
@@ -61,11 +20,11 @@ def validate_speech_content(audio_path, word_id):
     print(f"📝 I Heard: '{text}'")
 
     # 2. Validation Logic
-    if word_id not in EXPECTED_TEXT_MAP:
-        print("⚠️ No expected text map found for this ID. Skipping validation.")
+    allowed_phrases = CATALOG.expected_text(word_id)
+    if allowed_phrases is None:
+        print("⚠️ No expected text found in the catalog for this ID. Skipping validation.")
         return True
 
-    allowed_phrases = EXPECTED_TEXT_MAP[word_id]
     print(f"✅ Expected: {allowed_phrases}")
 
     # Check for exact or fuzzy match